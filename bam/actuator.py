@@ -8,55 +8,21 @@
 
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Union
-
-import numpy as np
 from .testbench import Testbench
+from .backend import ArrayLike, Backend, NumpyBackend, TorchBackend
 from bam.parameter import Parameter
 
-if TYPE_CHECKING:
-    import torch
-
-# Anything the control law / torque equations can operate on elementwise. The
-# concrete backend (numpy or torch, see :class:`Backend`) decides how ``clamp``
-# behaves; the arithmetic itself broadcasts identically over scalars, numpy
-# arrays and torch tensors.
-ArrayLike = Union[float, np.ndarray, "torch.Tensor"]
-
-
-class Backend:
-    """Abstracts the array library so the actuator math is vectorization-agnostic.
-
-    Only operations that differ between numpy and torch (currently ``clamp``)
-    live here; plain arithmetic (``+``, ``*``, ``**``, ``np.sign`` …) broadcasts
-    the same way for both, so it is written directly in the actuator methods.
-    """
-
-    def clamp(self, x: ArrayLike, low: ArrayLike, high: ArrayLike) -> ArrayLike:
-        raise NotImplementedError
-
-    def sign(self, x: ArrayLike) -> ArrayLike:
-        raise NotImplementedError
-
-
-class NumpyBackend(Backend):
-    def clamp(self, x: ArrayLike, low: ArrayLike, high: ArrayLike) -> ArrayLike:
-        return np.clip(x, low, high)
-
-    def sign(self, x: ArrayLike) -> ArrayLike:
-        return np.sign(x)
-
-
-class TorchBackend(Backend):
-    def clamp(self, x: ArrayLike, low: ArrayLike, high: ArrayLike) -> ArrayLike:
-        import torch
-
-        return torch.clamp(x, low, high)
-
-    def sign(self, x: ArrayLike) -> ArrayLike:
-        import torch
-
-        return torch.sign(x)
+# The backends used to be defined here, they are still importable from this module
+__all__ = [
+    "Actuator",
+    "ArrayLike",
+    "Backend",
+    "CurrentControlledActuator",
+    "DCMotorActuator",
+    "NumpyBackend",
+    "TorchBackend",
+    "VoltageControlledActuator",
+]
 
 
 class Actuator:
@@ -72,6 +38,10 @@ class Actuator:
         is loaded (typically :class:`~bam.testbench.Pendulum`).
     """
 
+    #: Whether :meth:`compute_control` keeps an internal state from a step to the
+    #: next (carried over the resets of a rollout)
+    control_state: bool = False
+
     def __init__(self, testbench_class: Testbench):
         self.testbench_class = testbench_class
         self.testbench: Testbench | None = None
@@ -97,6 +67,7 @@ class Actuator:
         :param log: Log dict as loaded from a processed JSON file.
         """
         self.testbench = self.testbench_class(log)
+        self.testbench.backend = self.backend
 
     def initialize(self):
         """Create motor parameters on the attached model.
@@ -26,11 +26,11 @@ from matplotlib.gridspec import GridSpec
 from matplotlib.patches import Circle, FancyBboxPatch, Rectangle
 from matplotlib.animation import FuncAnimation, FFMpegWriter, PillowWriter
 
-import json
-
 from .model import load_model, DummyModel
 from .actuators import actuators
 from . import simulate
+from . import logs
+from .cache import RolloutCache, rollout_options
 
 # --- Flat "poster" palette (matches the reference illustration) ---
 COL_ARM = "#c9a94e"
@@ -74,16 +74,23 @@ arg_parser.add_argument(
     default=None,
     help="Save to this path (.mp4 or .gif) instead of showing a window.",
 )
+arg_parser.add_argument(
+    "--cache",
+    type=str,
+    default=None,
+    help="Directory of the rollouts cache (default: ~/.cache/bam/rollouts)",
+)
+arg_parser.add_argument(
+    "--no-cache",
+    dest="no_cache",
+    action="store_true",
+    help="Simulate all the rollouts, without reading nor writing the cache",
+)
 args = arg_parser.parse_args()
 
 
 def load_log():
-    with open(args.log) as f:
-        log = json.load(f)
-    log["filename"] = args.log
-    if "arm_mass" not in log:
-        log["arm_mass"] = 0.0
-    return log
+    return logs.load_log(args.log)
 
 
 def compute_series(log):
@@ -101,12 +108,26 @@ def compute_series(log):
     controls = np.array([0.0 if c is None else c for c in controls])
     torque_enable = np.array([e["torque_enable"] for e in log["entries"]])
 
+    cache = None if args.no_cache else RolloutCache(args.cache)
     models = []
     for model_name in args.params:
         model = load_model(model_name)
-        sim_q, sim_speed, sim_controls = simulate.Simulator(model).rollout_log(
-            log, reset_period=args.reset_period, simulate_control=True
-        )
+
+        def rollout(model=model):
+            return simulate.Simulator(model).rollout_log(
+                log, reset_period=args.reset_period, simulate_control=True
+            )
+
+        if cache is not None:
+            sim_q, sim_speed, sim_controls = cache.rollout(
+                model_name,
+                log,
+                "reference",
+                rollout,
+                **rollout_options("reference", args.reset_period),
+            )
+        else:
+            sim_q, sim_speed, sim_controls = rollout()
         models.append(
             {
                 "name": model.name or model_name,
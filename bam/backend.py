@@ -0,0 +1,96 @@
+# Copyright 2025 Marc Duclusaud & Grégoire Passault
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Union
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import torch
+
+# Anything the control law / torque equations can operate on elementwise. The
+# concrete backend (numpy or torch, see :class:`Backend`) decides how ``clamp``
+# behaves; the arithmetic itself broadcasts identically over scalars, numpy
+# arrays and torch tensors.
+ArrayLike = Union[float, np.ndarray, "torch.Tensor"]
+
+
+class Backend:
+    """Abstracts the array library so the actuator math is vectorization-agnostic.
+
+    Only operations that differ between numpy and torch (``clamp``, ``sign``,
+    ``minimum`` and the transcendental functions) live here; plain arithmetic
+    (``+``, ``*``, ``**``, builtin ``abs`` …) broadcasts the same way for both,
+    so it is written directly in the actuator, testbench and model methods.
+    """
+
+    def clamp(self, x: ArrayLike, low: ArrayLike, high: ArrayLike) -> ArrayLike:
+        raise NotImplementedError
+
+    def sign(self, x: ArrayLike) -> ArrayLike:
+        raise NotImplementedError
+
+    def minimum(self, x: ArrayLike, y: ArrayLike) -> ArrayLike:
+        raise NotImplementedError
+
+    def exp(self, x: ArrayLike) -> ArrayLike:
+        raise NotImplementedError
+
+    def sin(self, x: ArrayLike) -> ArrayLike:
+        raise NotImplementedError
+
+
+class NumpyBackend(Backend):
+    def clamp(self, x: ArrayLike, low: ArrayLike, high: ArrayLike) -> ArrayLike:
+        return np.clip(x, low, high)
+
+    def sign(self, x: ArrayLike) -> ArrayLike:
+        return np.sign(x)
+
+    def minimum(self, x: ArrayLike, y: ArrayLike) -> ArrayLike:
+        return np.minimum(x, y)
+
+    def exp(self, x: ArrayLike) -> ArrayLike:
+        return np.exp(x)
+
+    def sin(self, x: ArrayLike) -> ArrayLike:
+        return np.sin(x)
+
+
+class TorchBackend(Backend):
+    def clamp(self, x: ArrayLike, low: ArrayLike, high: ArrayLike) -> ArrayLike:
+        import torch
+
+        # torch.clamp doesn't accept a tensor bound mixed with a number bound
+        if isinstance(low, torch.Tensor) != isinstance(high, torch.Tensor):
+            low = torch.as_tensor(low, dtype=x.dtype, device=x.device)
+            high = torch.as_tensor(high, dtype=x.dtype, device=x.device)
+
+        return torch.clamp(x, low, high)
+
+    def sign(self, x: ArrayLike) -> ArrayLike:
+        import torch
+
+        return torch.sign(x)
+
+    def minimum(self, x: ArrayLike, y: ArrayLike) -> ArrayLike:
+        import torch
+
+        return torch.minimum(torch.as_tensor(x), torch.as_tensor(y))
+
+    def exp(self, x: ArrayLike) -> ArrayLike:
+        import torch
+
+        return torch.exp(x)
+
+    def sin(self, x: ArrayLike) -> ArrayLike:
+        import torch
+
+        return torch.sin(x)
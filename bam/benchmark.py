@@ -0,0 +1,558 @@
+# Copyright 2025 Marc Duclusaud & Grégoire Passault
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+"""Parity checks and speed benchmarks of the simulation backends.
+
+Usage::
+
+    python -m bam.benchmark rollout --logdir data_processed/ --actuator mx64
+    python -m bam.benchmark rollout --logdir data_processed/ --params params.json
+    python -m bam.benchmark segments --logdir data_processed/ --actuator mx64 \
+        --reset_period 0.5
+    python -m bam.benchmark storage --workers 1 2 4 8
+    python -m bam.benchmark controller --joints 24 --boxes 20
+    python -m bam.benchmark fused --groups mx64/m6 mx106/m6 xl330/m6
+
+``rollout`` rolls out each model (m1–m6, with their default parameters, or the
+ones of a params file) over the whole log directory with both the reference
+simulator and the compiled (Numba) one. It reports the largest trajectory
+deviation between the two and the time spent per rollout, and exits with an
+error if a deviation exceeds the tolerance.
+
+``segments`` compares, with a reset period, the rollouts of the whole log
+directory step by step (``rollout_log``) and with all the segments between the
+resets simulated in parallel (``rollout_segments``, used by ``bam.fit
+--parallel_segments``), with the reference or the compiled simulator. It fails
+for the actuators with an internal control state, whose segments are not
+independent.
+
+``controller`` measures the extraction of the DOF friction constraint forces in
+:meth:`bam.mujoco.MujocoController.update`, against the former selection over
+all the (actuators x constraints) pairs, on a scene of actuated joints and free
+boxes resting on the floor, whose contacts add many constraint rows.
+
+``fused`` simulates the same scene twice, controlled by the groups of a
+:func:`bam.mujoco.load_config` file (one bundled motor/model per group): with a
+controller per group, and with the single fused one. It reports the deviation of
+the joint positions and the time spent per step updating the controllers.
+
+``storage`` measures the throughput (trials per second) of the storages of the
+study shared by the workers of ``bam.fit --workers`` (SQLite database or journal
+file), for several numbers of workers. The objective is trivial, so that the
+storage is the bottleneck, as it becomes with fast rollouts.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from multiprocessing import Process
+
+import numpy as np
+
+from . import message, simulate
+from .actuators import actuators
+from .logs import Logs
+from .model import load_model, models
+
+
+def timed(function, repeat: int) -> tuple:
+    """
+    Calls function repeat times, returns its last result and the best duration [s]
+    """
+    durations = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = function()
+        durations.append(time.perf_counter() - t0)
+    return result, min(durations)
+
+
+def benchmark_rollout(args) -> bool:
+    from . import numba as numba_backend
+
+    logs = Logs(args.logdir)
+    dataset = logs.compile()
+    print(f"{len(dataset)} logs, {dataset.n_steps} steps")
+
+    success = True
+    for model_name in args.models:
+        if args.params is not None:
+            model = load_model(args.params)
+        else:
+            model = models[model_name]()
+            model.set_actuator(actuators[args.actuator]())
+
+        if args.popsize > 1:
+            # Random parameters within the optimization bounds
+            rng = np.random.default_rng(0)
+            model.set_parameters_batch(
+                {
+                    name: rng.uniform(parameter.min, parameter.max, args.popsize)
+                    for name, parameter in model.get_parameters().items()
+                    if parameter.optimize
+                }
+            )
+            reference = simulate.Simulator(model).rollout_batch
+            compiled = numba_backend.Simulator(model).rollout_batch
+        else:
+            reference = simulate.Simulator(model).rollout_log
+            compiled = numba_backend.Simulator(model).rollout_log
+
+        def rollout(simulator):
+            return simulator(
+                dataset, reset_period=args.reset_period, simulate_control=True
+            )
+
+        # Warm up (jit compilation, or loading from the cache)
+        rollout(compiled)
+
+        reference_result, reference_duration = timed(
+            lambda reference=reference: rollout(reference), args.repeat
+        )
+        compiled_result, compiled_duration = timed(
+            lambda compiled=compiled: rollout(compiled), args.repeat
+        )
+
+        error = max(
+            np.max(np.abs(np.array(a, dtype=float) - np.array(b, dtype=float)))
+            for a, b in zip(reference_result, compiled_result)
+        )
+        result = f"- {model.name}: max error {error:.2e}, "
+        result += f"reference {reference_duration * 1000:.1f} ms, "
+        result += f"compiled {compiled_duration * 1000:.1f} ms "
+        result += f"(x{reference_duration / compiled_duration:.1f})"
+        if error > args.tolerance:
+            success = False
+            result += message.red(" MISMATCH")
+        print(result)
+
+    return success
+
+
+def benchmark_segments(args) -> bool:
+    if args.numba:
+        from . import numba as numba_backend
+
+    logs = Logs(args.logdir)
+    dataset = logs.compile()
+    starts = simulate.reset_steps(
+        dataset.n_steps, np.max(dataset["dt"]), args.reset_period
+    )
+    print(
+        f"{len(dataset)} logs, {dataset.n_steps} steps, "
+        f"{len(dataset) * len(starts)} segments"
+    )
+
+    success = True
+    for model_name in args.models:
+        if args.params is not None:
+            model = load_model(args.params)
+        else:
+            model = models[model_name]()
+            model.set_actuator(actuators[args.actuator]())
+        if args.numba:
+            simulator = numba_backend.Simulator(model)
+            # Warm up (jit compilation, or loading from the cache)
+            simulator.rollout_log(dataset, args.reset_period, simulate_control=True)
+        else:
+            simulator = simulate.Simulator(model)
+
+        sequential_result, sequential_duration = timed(
+            lambda simulator=simulator: simulator.rollout_log(
+                dataset, args.reset_period, simulate_control=True
+            ),
+            args.repeat,
+        )
+        if model.actuator.control_state:
+            # The segments are not independent, bam.fit rejects --parallel_segments
+            success = False
+            print(
+                f"- {model.name}: "
+                + message.red("UNSUPPORTED (internal control state)")
+            )
+            continue
+        segments_result, segments_duration = timed(
+            lambda simulator=simulator: simulator.rollout_segments(
+                dataset, args.reset_period, simulate_control=True
+            ),
+            args.repeat,
+        )
+
+        mask = dataset.mask.T
+        error = max(
+            np.max(np.abs(np.array(a, dtype=float) - np.array(b, dtype=float))[mask])
+            for a, b in zip(sequential_result, segments_result)
+        )
+        result = f"- {model.name}: max error {error:.2e}, "
+        result += f"sequential {sequential_duration * 1000:.1f} ms, "
+        result += f"segments {segments_duration * 1000:.1f} ms "
+        result += f"(x{sequential_duration / segments_duration:.1f})"
+        if error > args.tolerance:
+            success = False
+            result += message.red(" MISMATCH")
+        print(result)
+
+    return success
+
+
+def make_controller_scene(n_joints: int, n_boxes: int):
+    """
+    MuJoCo scene of n_joints actuated hinges (small pendulums) and n_boxes free
+    boxes resting on the floor, returns its model and data
+    """
+    import mujoco
+
+    spec = mujoco.MjSpec()
+    spec.worldbody.add_geom(
+        type=mujoco.mjtGeom.mjGEOM_PLANE, size=[5.0, 5.0, 0.1], pos=[0, 0, 0]
+    )
+    # The hinges come first, so that their joint and DOF ids are the same (as the
+    # former extraction expects)
+    for i in range(n_joints):
+        body = spec.worldbody.add_body(name=f"link{i}", pos=[0.3 * i, -1.0, 1.0])
+        body.add_joint(
+            name=f"joint{i}", type=mujoco.mjtJoint.mjJNT_HINGE, axis=[1, 0, 0]
+        )
+        body.add_geom(
+            type=mujoco.mjtGeom.mjGEOM_CAPSULE,
+            fromto=[0, 0, 0, 0, 0, -0.1],
+            size=[0.01, 0, 0],
+            contype=0,
+            conaffinity=0,
+        )
+        actuator = spec.add_actuator(name=f"joint{i}")
+        actuator.target = f"joint{i}"
+        actuator.trntype = mujoco.mjtTrn.mjTRN_JOINT
+    for i in range(n_boxes):
+        body = spec.worldbody.add_body(pos=[0.3 * i, 1.0, 0.05])
+        body.add_freejoint()
+        body.add_geom(type=mujoco.mjtGeom.mjGEOM_BOX, size=[0.05, 0.05, 0.05])
+
+    mujoco_model = spec.compile()
+    return mujoco_model, mujoco.MjData(mujoco_model)
+
+
+def legacy_friction_force(controller) -> np.ndarray:
+    """
+    Friction constraint forces as formerly extracted by MujocoController.update(),
+    selecting among all the (actuators x constraints) pairs
+    """
+    import mujoco
+
+    data = controller.mujoco_data
+    efc_id_repeated = np.repeat([data.efc_id], len(controller.actuator), axis=0)
+    id_repeated = np.repeat([controller.joint_indexes], len(data.efc_id), axis=0).T
+    selector = efc_id_repeated == id_repeated
+    selector = selector * (
+        data.efc_type == mujoco.mjtConstraint.mjCNSTR_FRICTION_DOF.value
+    )
+    return np.sum(data.efc_force * selector, axis=1)
+
+
+def benchmark_controller(args) -> bool:
+    import mujoco
+
+    from .mujoco import MujocoController
+
+    mujoco_model, mujoco_data = make_controller_scene(args.joints, args.boxes)
+    if args.params is not None:
+        model = load_model(args.params)
+    else:
+        model = models[args.model]()
+        model.set_actuator(actuators[args.actuator]())
+    controller = MujocoController(
+        model,
+        [f"joint{i}" for i in range(args.joints)],
+        mujoco_model,
+        mujoco_data,
+    )
+    controller.q_target = np.linspace(-1.0, 1.0, args.joints)
+
+    success = True
+    error = 0.0
+    durations = {"legacy": 0.0, "gathered": 0.0, "update": 0.0}
+    for _ in range(args.steps):
+        t0 = time.perf_counter()
+        controller.update()
+        t1 = time.perf_counter()
+        legacy = legacy_friction_force(controller)
+        t2 = time.perf_counter()
+        gathered = controller._dof_friction_force()
+        t3 = time.perf_counter()
+        durations["update"] += t1 - t0
+        durations["legacy"] += t2 - t1
+        durations["gathered"] += t3 - t2
+        error = max(error, np.max(np.abs(legacy - gathered)))
+        mujoco.mj_step(mujoco_model, mujoco_data)
+
+    print(
+        f"{args.joints} actuated joints, {args.boxes} boxes, "
+        f"{mujoco_data.nefc} constraint rows ({mujoco_data.nf} friction)"
+    )
+    result = f"- friction forces: max error {error:.2e}, "
+    result += f"legacy {durations['legacy'] / args.steps * 1e6:.1f} us, "
+    result += f"gathered {durations['gathered'] / args.steps * 1e6:.1f} us "
+    result += f"(x{durations['legacy'] / durations['gathered']:.1f}), "
+    result += f"whole update {durations['update'] / args.steps * 1e6:.1f} us"
+    if error > args.tolerance:
+        success = False
+        result += message.red(" MISMATCH")
+    print(result)
+
+    return success
+
+
+def benchmark_fused(args) -> bool:
+    import json
+
+    import mujoco
+
+    from .model import _resolve_json_path
+    from .mujoco import load_config
+
+    # Configuration file spreading the joints evenly over the groups
+    config = {}
+    for index, group in enumerate(args.groups):
+        motor_name, model_name = group.split("/")
+        with open(_resolve_json_path(None, motor_name, model_name)) as f:
+            params = json.load(f)
+        actuator = actuators[params["actuator"]]()
+        config[f"group{index}"] = {
+            "dofs": [
+                f"joint{i}" for i in range(args.joints) if i % len(args.groups) == index
+            ],
+            "model": params,
+            "error_gain": actuator.error_gain,
+            "max_pwm": actuator.max_pwm,
+        }
+
+    scenes = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "config.json")
+        with open(path, "w") as f:
+            json.dump(config, f)
+        for fused in [False, True]:
+            mujoco_model, mujoco_data = make_controller_scene(args.joints, args.boxes)
+            controllers, _ = load_config(
+                path, mujoco_model, mujoco_data, args.kp, args.vin, fused=fused
+            )
+            if fused:
+                controllers = {"fused": controllers}
+            scenes[fused] = (mujoco_model, mujoco_data, controllers)
+
+    success = True
+    error = 0.0
+    durations = {False: 0.0, True: 0.0}
+    for step in range(args.steps):
+        q_target = np.sin(np.arange(args.joints) + step * 0.01)
+        for fused, (mujoco_model, mujoco_data, controllers) in scenes.items():
+            for controller in controllers.values():
+                for name in controller.actuator:
+                    controller.set_q_target(name, q_target[int(name[5:])])
+            t0 = time.perf_counter()
+            for controller in controllers.values():
+                controller.update()
+            durations[fused] += time.perf_counter() - t0
+            mujoco.mj_step(mujoco_model, mujoco_data)
+        error = max(error, np.max(np.abs(scenes[False][1].qpos - scenes[True][1].qpos)))
+
+    fused_controller = scenes[True][2]["fused"]
+    print(
+        f"{args.joints} actuated joints, {len(config)} groups "
+        f"({len(fused_controller.groups)} stacked models), {args.boxes} boxes"
+    )
+    result = f"- max position error {error:.2e}, "
+    result += f"per model {durations[False] / args.steps * 1e6:.1f} us, "
+    result += f"fused {durations[True] / args.steps * 1e6:.1f} us "
+    result += f"(x{durations[False] / durations[True]:.1f})"
+    if error > args.tolerance:
+        success = False
+        result += message.red(" MISMATCH")
+    print(result)
+
+    return success
+
+
+def make_storage(storage: str, directory: str):
+    import optuna
+
+    if storage == "journal":
+        return optuna.storages.JournalStorage(
+            optuna.storages.journal.JournalFileBackend(f"{directory}/study.journal")
+        )
+    return f"sqlite:///{directory}/study.db"
+
+
+def storage_worker(storage: str, directory: str, n_params: int, n_trials: int):
+    import optuna
+
+    def objective(trial):
+        return sum(
+            trial.suggest_float(f"x{i}", -1.0, 1.0) ** 2 for i in range(n_params)
+        )
+
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    study = optuna.load_study(
+        study_name="benchmark",
+        storage=make_storage(storage, directory),
+        sampler=optuna.samplers.RandomSampler(),
+    )
+    study.optimize(objective, n_trials=n_trials)
+
+
+def benchmark_storage(args) -> bool:
+    import optuna
+
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    print(f"{args.trials} trials per worker, {args.params} parameters")
+    for storage in args.storages:
+        for n_workers in args.workers:
+            with tempfile.TemporaryDirectory() as directory:
+                optuna.create_study(
+                    study_name="benchmark", storage=make_storage(storage, directory)
+                )
+                workers = [
+                    Process(
+                        target=storage_worker,
+                        args=(storage, directory, args.params, args.trials),
+                    )
+                    for _ in range(n_workers)
+                ]
+                t0 = time.perf_counter()
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+                duration = time.perf_counter() - t0
+
+            print(
+                f"- {storage}, {n_workers} workers: "
+                f"{n_workers * args.trials / duration:.1f} trials/s"
+            )
+
+    return True
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    subparsers = arg_parser.add_subparsers(dest="benchmark", required=True)
+
+    rollout_parser = subparsers.add_parser(
+        "rollout", help="Reference vs compiled (Numba) simulator"
+    )
+    rollout_parser.add_argument("--logdir", type=str, required=True)
+    rollout_parser.add_argument("--actuator", type=str, default=None)
+    rollout_parser.add_argument(
+        "--models", type=str, nargs="+", default=list(models.keys())
+    )
+    rollout_parser.add_argument(
+        "--params",
+        type=str,
+        default=None,
+        help="Params file to use instead of the default parameters of --models",
+    )
+    rollout_parser.add_argument(
+        "--popsize",
+        type=int,
+        default=1,
+        help="If greater than 1, roll out that many random parameter sets at once",
+    )
+    rollout_parser.add_argument("--reset_period", type=float, default=None)
+    rollout_parser.add_argument("--repeat", type=int, default=3)
+    rollout_parser.add_argument("--tolerance", type=float, default=1e-6)
+
+    segments_parser = subparsers.add_parser(
+        "segments", help="Sequential vs parallel segments rollouts with resets"
+    )
+    segments_parser.add_argument("--logdir", type=str, required=True)
+    segments_parser.add_argument("--actuator", type=str, default=None)
+    segments_parser.add_argument(
+        "--models", type=str, nargs="+", default=list(models.keys())
+    )
+    segments_parser.add_argument(
+        "--params",
+        type=str,
+        default=None,
+        help="Params file to use instead of the default parameters of --models",
+    )
+    segments_parser.add_argument("--reset_period", type=float, required=True)
+    segments_parser.add_argument(
+        "--numba", action="store_true", help="Use the compiled (Numba) simulator"
+    )
+    segments_parser.add_argument("--repeat", type=int, default=3)
+    segments_parser.add_argument("--tolerance", type=float, default=1e-6)
+
+    controller_parser = subparsers.add_parser(
+        "controller", help="Friction forces extraction of the MuJoCo controller"
+    )
+    controller_parser.add_argument("--joints", type=int, default=24)
+    controller_parser.add_argument("--boxes", type=int, default=20)
+    controller_parser.add_argument("--steps", type=int, default=1000)
+    controller_parser.add_argument("--actuator", type=str, default="mx64")
+    controller_parser.add_argument("--model", type=str, default="m6")
+    controller_parser.add_argument(
+        "--params",
+        type=str,
+        default=None,
+        help="Params file to use instead of the default parameters of --model",
+    )
+    controller_parser.add_argument("--tolerance", type=float, default=1e-9)
+
+    fused_parser = subparsers.add_parser(
+        "fused", help="Per-model vs fused MuJoCo controllers of load_config"
+    )
+    fused_parser.add_argument("--joints", type=int, default=24)
+    fused_parser.add_argument("--boxes", type=int, default=20)
+    fused_parser.add_argument("--steps", type=int, default=1000)
+    fused_parser.add_argument(
+        "--groups",
+        type=str,
+        nargs="+",
+        default=["mx64/m6", "mx106/m6", "xl330/m6", "xl320/m6"],
+        help="Bundled motor/model of each group of joints",
+    )
+    fused_parser.add_argument("--kp", type=float, default=32.0)
+    fused_parser.add_argument("--vin", type=float, default=12.0)
+    fused_parser.add_argument("--tolerance", type=float, default=1e-9)
+
+    storage_parser = subparsers.add_parser(
+        "storage", help="Trials/s of the bam.fit --storage options vs workers"
+    )
+    storage_parser.add_argument(
+        "--storages", type=str, nargs="+", default=["sqlite", "journal"]
+    )
+    storage_parser.add_argument(
+        "--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count()]
+    )
+    storage_parser.add_argument("--trials", type=int, default=200)
+    storage_parser.add_argument(
+        "--params", type=int, default=10, help="Number of parameters of a trial"
+    )
+    args = arg_parser.parse_args()
+
+    if args.benchmark in ["rollout", "segments"]:
+        if args.params is not None:
+            args.models = [load_model(args.params).name]
+        elif args.actuator is None:
+            arg_parser.error(
+                f"{args.benchmark}: either --actuator or --params is required"
+            )
+    if args.benchmark == "rollout":
+        success = benchmark_rollout(args)
+    elif args.benchmark == "segments":
+        success = benchmark_segments(args)
+    elif args.benchmark == "controller":
+        success = benchmark_controller(args)
+    elif args.benchmark == "fused":
+        success = benchmark_fused(args)
+    elif args.benchmark == "storage":
+        success = benchmark_storage(args)
+
+    if not success:
+        raise SystemExit(1)
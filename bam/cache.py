@@ -0,0 +1,226 @@
+# Copyright 2025 Marc Duclusaud & Grégoire Passault
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+"""On-disk cache of rollout results.
+
+``bam.mae``, ``bam.plot`` and ``bam.animate`` roll out the same (params file,
+log) combinations again and again. Their rollouts are stored in a directory, in
+``.npz`` files (positions, velocities and controls arrays) named after a hash of
+everything the result depends on:
+
+- the parameters (content of the params file, not its path),
+- the processed log (metadata and channels values, not its filename),
+- the simulator backend and the rollout options (``reset_period`` …),
+- the source code of the ``bam`` package, so that the cache is invalidated by
+  any change of the simulation.
+
+The cache is bounded in size: when it grows over ``max_size``, the least
+recently used results are evicted.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import numpy as np
+
+from .logs import columns
+
+
+def default_directory() -> str:
+    """Default cache directory: ``$XDG_CACHE_HOME/bam/rollouts``."""
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(cache_home, "bam", "rollouts")
+
+
+_code_digest = None
+
+
+def code_digest() -> str:
+    """Hash of the source code of the ``bam`` package (computed once)."""
+    global _code_digest
+    if _code_digest is None:
+        package = os.path.dirname(os.path.abspath(__file__))
+        digest = hashlib.sha256()
+        for filename in sorted(glob.glob(f"{package}/**/*.py", recursive=True)):
+            digest.update(os.path.relpath(filename, package).encode())
+            with open(filename, "rb") as f:
+                digest.update(f.read())
+        _code_digest = digest.hexdigest()
+    return _code_digest
+
+
+def log_digest(log: dict) -> str:
+    """Hash of the content of a processed log (its filename excluded)."""
+    digest = hashlib.sha256()
+    metadata = {
+        key: value for key, value in log.items() if key not in ["entries", "filename"]
+    }
+    digest.update(json.dumps(metadata, sort_keys=True).encode())
+    for channel, values in sorted(columns(log).items()):
+        digest.update(channel.encode())
+        digest.update(np.asarray(values, dtype=float).tobytes())
+    return digest.hexdigest()
+
+
+def params_digest(params_file: str) -> str:
+    """Hash of the parameters of a params file."""
+    with open(params_file) as f:
+        params = json.load(f)
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+def rollout_options(
+    backend: str, reset_period: float | None = None, stacked: bool = False
+) -> dict:
+    """Options of the rollouts of ``bam.mae``, ``bam.plot`` and ``bam.animate``
+    with a backend, that are part of the cache keys. The reference (and numba)
+    rollouts simulate the control, the mujoco ones can be stacked in a scene."""
+    options = {"reset_period": reset_period}
+    if backend in ["reference", "numba"]:
+        options["simulate_control"] = True
+    if stacked:
+        options["stacked"] = True
+    return options
+
+
+class RolloutCache:
+    """Size-bounded, content-addressed cache of rollouts.
+
+    :param directory: Directory of the cache (created if needed), see
+        :func:`default_directory`.
+    :param max_size: Maximum size of the cache [bytes].
+    """
+
+    def __init__(self, directory: str | None = None, max_size: int = 1 << 30):
+        self.directory = directory or default_directory()
+        self.max_size = max_size
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Digests of the logs and params files, by id (logs) or path
+        self.log_digests: dict[int, tuple[dict, str]] = {}
+        self.params_digests: dict[str, str] = {}
+        # Size of the cache as of the last scan, plus the results stored since
+        # (None before the first scan)
+        self.size: int | None = None
+
+    def key(self, params_file: str, log: dict, backend: str, **options) -> str:
+        """Key of the rollout of a params file against a log.
+
+        :param params_file: Path to the params file.
+        :param log: Processed log dict.
+        :param backend: Name of the simulator backend.
+        :param options: Rollout options (``reset_period``, ``simulate_control``
+            …).
+        """
+        if id(log) not in self.log_digests:
+            # The log is kept alive, so that its id can't be reused
+            self.log_digests[id(log)] = (log, log_digest(log))
+        params_file = str(params_file)
+        if params_file not in self.params_digests:
+            self.params_digests[params_file] = params_digest(params_file)
+
+        key = {
+            "code": code_digest(),
+            "params": self.params_digests[params_file],
+            "log": self.log_digests[id(log)][1],
+            "backend": backend,
+            "options": options,
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+    def filename(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def get(self, key: str) -> tuple | None:
+        """Cached rollout.
+
+        :returns: The ``(positions, velocities, controls)`` arrays, or None if the
+            rollout is not in the cache.
+        """
+        filename = self.filename(key)
+        try:
+            with np.load(filename) as data:
+                result = (data["positions"], data["velocities"], data["controls"])
+        except (OSError, KeyError, ValueError):
+            return None
+
+        try:
+            # Marks the result as recently used
+            os.utime(filename)
+        except FileNotFoundError:
+            pass
+        return result
+
+    def put(self, key: str, positions, velocities, controls):
+        """Stores a rollout, and evicts the least recently used ones if the cache
+        is full."""
+        filename = self.filename(key)
+        # Written aside and renamed, so that concurrent readers never see a partial
+        # file
+        temporary = f"{filename}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            np.savez(
+                f,
+                positions=np.asarray(positions, dtype=float),
+                velocities=np.asarray(velocities, dtype=float),
+                controls=np.asarray(controls, dtype=float),
+            )
+        size = os.path.getsize(temporary)
+        os.replace(temporary, filename)
+
+        # The directory is only scanned when the tracked size exceeds max_size (it
+        # can overestimate it, when a result is overwritten or evicted by another
+        # process, but not miss the results stored here). The eviction then leaves
+        # some room, so that a full cache is not scanned again at the next put
+        if self.size is not None:
+            self.size += size
+        if self.size is None or self.size > self.max_size:
+            self.evict(int(0.9 * self.max_size) if self.size is not None else None)
+
+    def evict(self, max_size: int | None = None):
+        """Removes the least recently used results, down to ``max_size`` (by
+        default, the one of the cache)."""
+        if max_size is None:
+            max_size = self.max_size
+
+        files = []
+        for filename in glob.glob(os.path.join(self.directory, "*.npz")):
+            try:
+                stat = os.stat(filename)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, filename))
+
+        size = sum(file_size for _, file_size, _ in files)
+        for _, file_size, filename in sorted(files):
+            if size <= max_size:
+                break
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+            size -= file_size
+        self.size = size
+
+    def rollout(
+        self, params_file: str, log: dict, backend: str, function, **options
+    ) -> tuple:
+        """Cached rollout of a params file against a log, computed (and stored)
+        with function if it is not in the cache.
+
+        :param function: Function returning the ``(positions, velocities,
+            controls)`` of the rollout.
+        :returns: The ``(positions, velocities, controls)`` arrays.
+        """
+        key = self.key(params_file, log, backend, **options)
+        result = self.get(key)
+        if result is None:
+            result = tuple(np.asarray(values, dtype=float) for values in function())
+            self.put(key, *result)
+        return result
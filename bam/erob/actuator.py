@@ -10,7 +10,6 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING
 
-import numpy as np
 from bam.actuator import Actuator
 from bam.parameter import Parameter
 from bam.testbench import Testbench, Pendulum
@@ -62,7 +61,7 @@ class ErobActuator(Actuator):
         self, q_target: ArrayLike, q: ArrayLike, dq: ArrayLike, dt: float
     ) -> ArrayLike | None:
         # Target velocity is assumed to be 0
-        amps = (q_target - q) * self.kp + self.damping * np.sqrt(self.kp) * (0.0 - dq)
+        amps = (q_target - q) * self.kp + self.damping * self.kp**0.5 * (0.0 - dq)
         amps = self.backend.clamp(amps, -self.max_amps, self.max_amps)
 
         return amps
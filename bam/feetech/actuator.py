@@ -24,6 +24,9 @@ class STS3215Actuator(VoltageControlledActuator):
     Feetech STS3215 7.4v
     """
 
+    # The smoothed target (q_target_smooth) is carried from a step to the next
+    control_state = True
+
     def __init__(self, testbench_class: Testbench):
         super().__init__(
             testbench_class,
@@ -46,7 +49,8 @@ class STS3215Actuator(VoltageControlledActuator):
     def load_log(self, log: dict):
         super().load_log(log)
 
-        self.q_target_smooth = np.zeros_like(self.kp)
+        # Zero, with the shape (and array type) of kp
+        self.q_target_smooth = 0.0 * self.kp
 
     def initialize(self):
         # Torque constant [Nm/A] or [V/(rad/s)]
@@ -7,18 +7,125 @@
 #     http://www.apache.org/licenses/LICENSE-2.0
 
 import glob
+import os
 import numpy as np
 import copy
 import random
 import json
+from collections.abc import Sequence
+from typing import ClassVar
+from multiprocessing import shared_memory
 from . import message
 
 
+class ColumnarEntries(Sequence):
+    """Entries of a log stored in columns (see :func:`save_log`).
+
+    Behaves like the list of entry dicts of a JSON log, but the values are read on
+    demand from a ``(C x T)`` array, typically memory-mapped. The columns can also
+    be accessed directly with :meth:`column`, which is how they are compiled in a
+    :class:`Dataset`.
+
+    :param array: ``(C x T)`` array of the values of the C channels.
+    :param channels: Names of the channels (entry keys), in the array order.
+    """
+
+    # Channels stored as floats, whose entries values are bools
+    bool_channels: ClassVar[list[str]] = ["torque_enable"]
+
+    def __init__(self, array: np.ndarray, channels: list[str]):
+        self.array = array
+        self.channels = list(channels)
+
+    def __len__(self) -> int:
+        return self.array.shape[1]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ColumnarEntries(self.array[:, index], self.channels)
+
+        values = self.array[:, index]
+        return {
+            channel: bool(value) if channel in self.bool_channels else float(value)
+            for channel, value in zip(self.channels, values)
+        }
+
+    def column(self, channel: str) -> np.ndarray:
+        """Values of a channel at all the steps, a ``(T)`` array."""
+        return self.array[self.channels.index(channel)]
+
+
+def load_log(filename: str) -> dict:
+    """Load a processed log, from a JSON file or a columnar log header.
+
+    The array of a columnar log is memory-mapped, its entries are a
+    :class:`ColumnarEntries` sequence.
+
+    :param filename: Path to the JSON file (or to the header of a columnar log).
+    :returns: The log dict, with its ``filename``.
+    """
+    with open(filename) as f:
+        log = json.load(f)
+
+    if "columns" in log:
+        columns = log.pop("columns")
+        path = os.path.join(os.path.dirname(filename), columns["file"])
+        array = np.load(path, mmap_mode="r")
+        log["entries"] = ColumnarEntries(array, columns["channels"])
+
+    log["filename"] = filename
+    if "arm_mass" not in log:
+        # The Dynamixel recorder writes the hyphenated key
+        log["arm_mass"] = log.pop("arm-mass", 0.0)
+
+    return log
+
+
+def save_log(log: dict, filename: str, columnar: bool = False):
+    """Save a processed log, as JSON or in columns.
+
+    A columnar log is made of a small JSON header (``filename``, holding the log
+    metadata and the description of the columns) and of a ``.npy`` array of the
+    entries values, one row per entry key. It is loaded by :func:`load_log` (and
+    thus :class:`Logs`) like a JSON log, and converts back to the same JSON.
+
+    :param log: Log dict (with JSON or columnar entries).
+    :param filename: Path of the JSON file (or of the columnar log header).
+    :param columnar: Whether to save the log in columns.
+    """
+    data = {
+        key: value for key, value in log.items() if key not in ["entries", "filename"]
+    }
+    entries = log["entries"]
+
+    if columnar:
+        channels = list(entries[0].keys())
+        if isinstance(entries, ColumnarEntries):
+            array = np.asarray(entries.array, dtype=float)
+        else:
+            array = np.array(
+                [[entry[channel] for entry in entries] for channel in channels],
+                dtype=float,
+            )
+        array_filename = os.path.splitext(filename)[0] + ".npy"
+        np.save(array_filename, array)
+        data["columns"] = {
+            "file": os.path.basename(array_filename),
+            "channels": channels,
+        }
+    else:
+        data["entries"] = [dict(entry) for entry in entries]
+
+    with open(filename, "w") as f:
+        json.dump(data, f)
+
+
 class Logs:
     """Collection of processed trajectory logs used for identification.
 
     Loads all JSON files found in a directory (produced by ``python -m bam.process``)
-    and exposes them as a list of log dicts.  Each log dict contains the pendulum
+    and exposes them as a list of log dicts (see :func:`load_log`, columnar logs are
+    memory-mapped).  Each log dict contains the pendulum
     configuration (mass, arm_mass, length, kp, vin) and a list of timestep entries with
     position, velocity, and control values.
 
@@ -30,15 +137,7 @@ class Logs:
         self.directory: str = directory
         self.json_files = glob.glob(f"{self.directory}/*.json")
 
-        self.logs = []
-        for json_file in self.json_files:
-            with open(json_file) as f:
-                data = json.load(f)
-                data["filename"] = json_file
-                if "arm_mass" not in data:
-                    # The Dynamixel recorder writes the hyphenated key
-                    data["arm_mass"] = data.pop("arm-mass", 0.0)
-                self.logs.append(data)
+        self.logs = [load_log(json_file) for json_file in self.json_files]
 
     def split(self, selector_kp: int) -> "Logs":
         """Split logs by P-gain value to create a validation set.
@@ -73,11 +172,61 @@ class Logs:
 
         return other_logs
 
-    def make_batch(self) -> dict:
+    def subset(self, fraction: float, seed: int = 0) -> "Logs":
+        """Randomly select a fraction of the logs.
+
+        The selection is reproducible (for a given ``seed``) and keeps at least one
+        log. The log dicts are shared with ``self``, not copied.
+
+        :param fraction: Fraction of the logs to keep, in ]0, 1].
+        :param seed: Seed of the random selection.
+        :returns: A new :class:`Logs` object containing the selected logs.
+        """
+        n_logs = max(1, round(fraction * len(self.logs)))
+        indices = sorted(
+            np.random.default_rng(seed).choice(len(self.logs), n_logs, replace=False)
+        )
+
+        logs = copy.copy(self)
+        logs.json_files = [self.json_files[i] for i in indices]
+        logs.logs = [self.logs[i] for i in indices]
+
+        return logs
+
+    def decimate(self, factor: int) -> "Logs":
+        """Resample the logs to a coarser timestep.
+
+        Keeps one entry every ``factor`` entries, and multiplies ``dt`` accordingly.
+        Rollouts against decimated logs are cheaper and less accurate.
+
+        :param factor: Decimation factor (1 returns the same logs).
+        :returns: A new :class:`Logs` object containing the decimated logs.
+        """
+        logs = copy.copy(self)
+        logs.logs = [
+            {**log, "dt": log["dt"] * factor, "entries": log["entries"][::factor]}
+            for log in self.logs
+        ]
+
+        return logs
+
+    def compile(self) -> "Dataset":
+        """Compile the logs in a structure-of-arrays :class:`Dataset`.
+
+        :returns: The compiled dataset, whose logs are in the same order.
+        """
+        return Dataset(self.logs)
+
+    def make_batch(self, pad: bool = False) -> dict:
         """
         Make a batch log from all the logs. In a batch log, all entries are vectorized.
         For example, batch["mass"] is a vector of all masses
         batch["entries"][0]["position"] will be a vector of all positions
+
+        By default, the logs are truncated to the shortest one. With pad, they are
+        padded to the longest one instead, by repeating their last entry. Each entry
+        then has a "mask" vector telling which logs are valid at that step, and
+        batch["lengths"] is the vector of the logs lengths
         """
         batch: dict = {"entries": []}
 
@@ -85,9 +234,10 @@ class Logs:
             if key != "entries":
                 batch[key] = np.array([log[key] for log in self.logs])
 
-        entries_min_length = min([len(log["entries"]) for log in self.logs])
-        entries_max_length = max([len(log["entries"]) for log in self.logs])
-        if entries_max_length > entries_min_length + 1:
+        lengths = np.array([len(log["entries"]) for log in self.logs])
+        entries_min_length = min(lengths)
+        entries_max_length = max(lengths)
+        if not pad and entries_max_length > entries_min_length + 1:
             print(
                 message.yellow(
                     f"WARNING: logs have significantly different lengths ({entries_min_length} to {entries_max_length})"
@@ -95,12 +245,328 @@ class Logs:
             )
 
         entry_keys = self.logs[0]["entries"][0].keys()
-        for k in range(entries_min_length):
+        n_steps = entries_max_length if pad else entries_min_length
+        for k in range(n_steps):
+            # Padding repeats the last entry of the shorter logs
+            entries = [
+                log["entries"][min(k, len(log["entries"]) - 1)] for log in self.logs
+            ]
             batch["entries"].append(
-                {
-                    key: np.array([log["entries"][k][key] for log in self.logs])
-                    for key in entry_keys
-                }
+                {key: np.array([entry[key] for entry in entries]) for key in entry_keys}
             )
+            if pad:
+                batch["entries"][-1]["mask"] = k < lengths
+
+        if pad:
+            batch["lengths"] = lengths
 
         return batch
+
+    def buckets(self, max_padding: float) -> list["Logs"]:
+        """Group the logs by length, to bound the padding of their batches.
+
+        The logs are sorted by length and split in consecutive groups, so that the
+        padding steps of each group (if padded to its longest log) are at most a
+        fraction ``max_padding`` of its steps.
+
+        :param max_padding: Maximum padding fraction of a group, in [0, 1[.
+        :returns: A list of :class:`Logs` objects, from the shortest logs to the
+            longest ones.
+        """
+        lengths = [len(log["entries"]) for log in self.logs]
+        order = sorted(range(len(self.logs)), key=lambda i: lengths[i])
+
+        groups = [[order[0]]]
+        for i in order[1:]:
+            group = groups[-1] + [i]
+            # The logs are sorted, i is the longest log of the group
+            steps = len(group) * lengths[i]
+            padding = steps - sum(lengths[j] for j in group)
+            if padding <= max_padding * steps:
+                groups[-1] = group
+            else:
+                groups.append([i])
+
+        buckets = []
+        for group in groups:
+            logs = copy.copy(self)
+            logs.json_files = [self.json_files[i] for i in group]
+            logs.logs = [self.logs[i] for i in group]
+            buckets.append(logs)
+
+        return buckets
+
+
+class Dataset:
+    """Logs compiled in a structure of arrays.
+
+    Each channel (``position``, ``speed``, ``goal_position``, ``torque_enable`` and
+    ``control``) is a contiguous ``(N x T)`` float array, N being the number of
+    logs and T the length of the longest one. Shorter logs are padded by repeating
+    their last entry, ``lengths`` and ``mask`` tell which steps are valid. A
+    channel that is missing from some of the logs is ``None``.
+
+    The metadata (``mass``, ``arm_mass``, ``length``, ``kp``, ``vin``, ``dt`` …)
+    are ``(N)`` arrays, accessed like the keys of a log batch (see
+    :meth:`Logs.make_batch`): ``dataset["mass"]``. A dataset can thus be rolled out
+    by the simulators directly.
+
+    :param logs: Log dicts (as loaded from processed JSON files).
+    """
+
+    channels: ClassVar[list[str]] = [
+        "position",
+        "speed",
+        "goal_position",
+        "torque_enable",
+        "control",
+    ]
+
+    def __init__(self, logs: list[dict]):
+        if len(logs) == 0:
+            raise ValueError("Can't compile an empty list of logs")
+
+        self.lengths = np.array([len(log["entries"]) for log in logs])
+        n_steps = np.max(self.lengths)
+        self.mask = np.arange(n_steps) < self.lengths[:, None]
+
+        for channel in self.channels:
+            array = None
+            if all(channel in log["entries"][0] for log in logs):
+                array = np.empty((len(logs), n_steps))
+                for k, log in enumerate(logs):
+                    if isinstance(log["entries"], ColumnarEntries):
+                        values = log["entries"].column(channel)
+                    else:
+                        values = [entry[channel] for entry in log["entries"]]
+                    array[k, : len(values)] = values
+                    array[k, len(values) :] = values[-1]
+            setattr(self, channel, array)
+
+        # Metadata shared by all the logs
+        self.metadata = {
+            key: np.array([log[key] for log in logs])
+            for key in logs[0]
+            if key != "entries" and all(key in log for log in logs)
+        }
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def __getitem__(self, key: str) -> np.ndarray:
+        return self.metadata[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.metadata
+
+    @property
+    def n_steps(self) -> int:
+        """Number of steps (T) of the channels arrays."""
+        return self.mask.shape[1]
+
+    def select(self, indices: list[int]) -> "Dataset":
+        """Select some of the logs.
+
+        :param indices: Indices of the logs to keep.
+        :returns: A new dataset, trimmed to the longest of the selected logs.
+        """
+        n_steps = np.max(self.lengths[indices])
+
+        def select(array):
+            return None if array is None else array[indices, :n_steps].copy()
+
+        dataset = copy.copy(self)
+        for channel in self.channels:
+            setattr(dataset, channel, select(getattr(self, channel)))
+        dataset.lengths = self.lengths[indices]
+        dataset.mask = select(self.mask)
+        dataset.metadata = {key: self.metadata[key][indices] for key in self.metadata}
+
+        return dataset
+
+    def segments(self, starts: np.ndarray) -> "Dataset":
+        """Cut the logs in segments.
+
+        Used to simulate the segments between the resets of a rollout
+        independently (see :meth:`bam.simulate.Simulator.rollout_segments`).
+
+        :param starts: First steps of the segments, in increasing order (the first
+            one being 0), shared by all the logs.
+        :returns: A new dataset of the N x S segments, segment s of log n being at
+            index ``n * S + s``. It is as long as the longest segment, shorter
+            segments are padded by repeating their last entry (and masked, as the
+            padding steps of the logs).
+        """
+        starts = np.asarray(starts)
+        ends = np.append(starts[1:], self.n_steps)
+        steps = starts[:, None] + np.arange(np.max(ends - starts))
+        in_segment = steps < ends[:, None]
+        steps = np.minimum(steps, ends[:, None] - 1)
+
+        def cut(array):
+            if array is None:
+                return None
+            return array[:, steps].reshape(len(self) * len(starts), steps.shape[1])
+
+        dataset = copy.copy(self)
+        for channel in self.channels:
+            setattr(dataset, channel, cut(getattr(self, channel)))
+        dataset.mask = cut(self.mask) & np.tile(in_segment, (len(self), 1))
+        dataset.lengths = np.count_nonzero(dataset.mask, axis=1)
+        dataset.metadata = {
+            key: np.repeat(value, len(starts)) for key, value in self.metadata.items()
+        }
+
+        return dataset
+
+    def map(self, function) -> "Dataset":
+        """Apply a function to the channels, the mask and the numerical metadata.
+
+        Used for instance to convert the dataset to torch tensors.
+
+        :param function: Function taking and returning an array.
+        :returns: A new dataset.
+        """
+        dataset = copy.copy(self)
+        for channel in self.channels:
+            array = getattr(self, channel)
+            setattr(dataset, channel, None if array is None else function(array))
+        dataset.mask = function(self.mask)
+        dataset.metadata = {
+            key: function(value) if value.dtype.kind in "biuf" else value
+            for key, value in self.metadata.items()
+        }
+
+        return dataset
+
+    def share(self) -> "SharedDataset":
+        """Copy the dataset to shared memory.
+
+        :returns: A picklable handle, from which other processes get the dataset
+            without copying it (see :class:`SharedDataset`).
+        """
+        return SharedDataset(self)
+
+
+class SharedDataset:
+    """A :class:`Dataset` stored in a shared memory block.
+
+    The arrays of the dataset (channels, lengths, mask and numerical metadata) are
+    copied once in a single block. The handle is small and picklable: it can be
+    sent to worker processes, where :meth:`dataset` attaches the block and returns
+    a dataset whose arrays are read-only views of the shared memory, whatever the
+    start method of the processes.
+
+    The process that creates the handle owns the block, and must :meth:`unlink`
+    it once all the processes are done with it.
+
+    :param dataset: Dataset to share.
+    """
+
+    def __init__(self, dataset: Dataset):
+        arrays = {"lengths": dataset.lengths, "mask": dataset.mask}
+        for channel in Dataset.channels:
+            if getattr(dataset, channel) is not None:
+                arrays[channel] = getattr(dataset, channel)
+        # Non-numerical metadata (filenames …) are small, they travel with the handle
+        self.metadata = {}
+        for key, value in dataset.metadata.items():
+            if value.dtype.kind in "biuf":
+                arrays[f"metadata/{key}"] = value
+            else:
+                self.metadata[key] = value
+
+        # (offset, shape, dtype) of the arrays in the block, 8-bytes aligned
+        self.layout = {}
+        size = 0
+        for key, array in arrays.items():
+            self.layout[key] = (size, array.shape, array.dtype.str)
+            size += -(-array.nbytes // 8) * 8
+
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.name = self.shm.name
+        for key, array in arrays.items():
+            self.view(key)[...] = array
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["shm"] = None
+        return state
+
+    def view(self, key: str) -> np.ndarray:
+        """Array of the block."""
+        if self.shm is None:
+            self.shm = shared_memory.SharedMemory(name=self.name)
+        offset, shape, dtype = self.layout[key]
+        return np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+
+    def dataset(self) -> Dataset:
+        """Attach the shared memory block.
+
+        :returns: A dataset backed by the block (its arrays are read-only).
+        """
+        dataset = Dataset.__new__(Dataset)
+
+        def view(key):
+            array = self.view(key)
+            array.flags.writeable = False
+            return array
+
+        dataset.lengths = view("lengths")
+        dataset.mask = view("mask")
+        for channel in Dataset.channels:
+            setattr(dataset, channel, view(channel) if channel in self.layout else None)
+        dataset.metadata = {
+            key[len("metadata/") :]: view(key)
+            for key in self.layout
+            if key.startswith("metadata/")
+        }
+        dataset.metadata.update(self.metadata)
+        # Keeps the block mapped as long as the dataset is alive
+        dataset.shared = self
+
+        return dataset
+
+    def unlink(self):
+        """Free the shared memory block (in the process that created it)."""
+        self.shm.unlink()
+
+
+def valid_steps(log: dict | Dataset) -> np.ndarray:
+    """Validity mask of the steps of a log, a log batch or a dataset.
+
+    Padding steps (see :meth:`Logs.make_batch` and :class:`Dataset`) are not valid.
+
+    :param log: Processed log dict, log batch or :class:`Dataset`.
+    :returns: A ``(T x N)`` bool array (N is 1 for a single log).
+    """
+    if isinstance(log, Dataset):
+        return log.mask.T
+
+    entries = log["entries"]
+    if "mask" in entries[0]:
+        return np.array([entry["mask"] for entry in entries])
+    return np.ones((len(entries), np.size(entries[0]["position"])), dtype=bool)
+
+
+def columns(log: dict | Dataset) -> dict:
+    """Time-major channels of a log, a log batch or a dataset.
+
+    ``columns(log)["position"][k]`` is the position (or the vector of positions of
+    the logs) at step k. Only the channels that are present are returned.
+
+    :param log: Processed log dict, log batch (see :meth:`Logs.make_batch`) or
+        :class:`Dataset`.
+    :returns: A dict channel → sequence of values.
+    """
+    if isinstance(log, Dataset):
+        return {
+            channel: getattr(log, channel).T
+            for channel in Dataset.channels
+            if getattr(log, channel) is not None
+        }
+
+    entries = log["entries"]
+    if isinstance(entries, ColumnarEntries):
+        return {channel: entries.column(channel) for channel in entries.channels}
+    return {key: [entry[key] for entry in entries] for key in entries[0]}
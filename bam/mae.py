@@ -14,210 +14,473 @@ Example::
     uv run python mae.py --params params/xl330/ --logdir data_processed/
     uv run python mae.py --params params/xl330/m4.json params/xl330/m6.json \
         --logdir data_processed/
+
+The comparison can also be run from Python, on logs loaded once::
+
+    from bam.logs import Logs
+    from bam.mae import evaluate
+
+    results = evaluate(["params/xl330/"], Logs("data_processed/"))
 """
 
 import argparse
 import json
+import multiprocessing
 from pathlib import Path
 
 import numpy as np
 import matplotlib.pyplot as plt
 
-from bam.logs import Logs
+from bam.logs import Logs, Dataset, columns
 from bam.model import load_model
 from bam import simulate
+from bam.cache import RolloutCache, rollout_options
+
+backends = ["reference", "numba", "mujoco", "mjlab"]
+
+
+def find_param_files(params: list[str]) -> list[Path]:
+    """Param files of a list of directories (containing *.json param files) and/or
+    param files."""
+    param_files = []
+    for params_entry in params:
+        params_path = Path(params_entry)
+        if params_path.is_dir():
+            found = sorted(params_path.glob("*.json"))
+            if not found:
+                raise FileNotFoundError(f"No *.json files found in {params_path}")
+            param_files += found
+        elif params_path.is_file():
+            param_files.append(params_path)
+        else:
+            raise FileNotFoundError(f"No such file or directory: {params_path}")
+    return param_files
+
+
+def make_labels(param_files: list[Path]) -> list[str]:
+    """Labels are the file stems (m4, m6, ...), unless two param files share the
+    same stem, in which case the paths are used to tell them apart."""
+    labels = [param_file.stem for param_file in param_files]
+    if len(set(labels)) != len(labels):
+        labels = [str(param_file) for param_file in param_files]
+    return labels
+
+
+def group_by_dt(dataset: Dataset) -> list:
+    """Groups of logs sharing the same dt, as ``(indices, dataset)`` tuples (the
+    reference simulator keeps a single reset clock for a batch of logs)."""
+    dt_groups: dict[float, list[int]] = {}
+    for i, dt in enumerate(dataset["dt"]):
+        dt_groups.setdefault(float(dt), []).append(i)
+    return [(indices, dataset.select(indices)) for indices in dt_groups.values()]
+
+
+def split_groups(groups: list, chunks: int) -> list:
+    """Splits each ``(indices, logs)`` group (see group_by_dt) in up to chunks
+    groups, so that all the processes have tasks."""
+    split = []
+    for group_indices, group in groups:
+        for chunk in np.array_split(np.arange(len(group_indices)), chunks):
+            if len(chunk) > 0:
+                split.append(([group_indices[i] for i in chunk], group.select(chunk)))
+    return split
 
-arg_parser = argparse.ArgumentParser(description="Compare BAM model MAEs")
-arg_parser.add_argument(
-    "--params",
-    type=str,
-    required=True,
-    nargs="+",
-    help="Directories containing *.json param files, and/or param files themselves",
-)
-arg_parser.add_argument(
-    "--logdir", type=str, required=True, help="Directory containing log files"
-)
-arg_parser.add_argument(
-    "--reset_period",
-    type=float,
-    default=None,
-    help="Reset period for simulation rollouts (s)",
-)
-arg_parser.add_argument(
-    "--sort",
-    action="store_true",
-    default=False,
-    help="Sort bars by MAE (default: keep evaluation order)",
-)
-arg_parser.add_argument("--no-sort", dest="sort", action="store_false")
-arg_parser.add_argument(
-    "--json",
-    type=str,
-    default=None,
-    help="Write results to this JSON file instead of plotting",
-)
-arg_parser.add_argument(
-    "--mujoco",
-    action="store_true",
-    help="Use the MuJoCo (CPU) simulator backend instead of the reference one",
-)
-arg_parser.add_argument(
-    "--mjlab",
-    action="store_true",
-    help="Use the mjlab (MuJoCo Warp / GPU) simulator backend, vectorized over all logs",
-)
-args = arg_parser.parse_args()
-
-if args.mujoco:
-    # Imported lazily so the default (reference) backend doesn't require MuJoCo.
-    from bam import mujoco as mujoco_backend
 
-if args.mjlab:
-    # Imported lazily so other backends don't require mjlab.
-    from bam import mjlab as mjlab_backend
+# ── MAE computation ───────────────────────────────────────────────────────────
+def _mae(positions, log_positions: np.ndarray) -> float:
+    return float(np.mean(np.abs(np.array(positions) - log_positions)))
 
-# ── Load logs ─────────────────────────────────────────────────────────────────
-logs = Logs(args.logdir)
-print(f"Loaded {len(logs.logs)} logs from {args.logdir}")
-
-# ── Discover param files ──────────────────────────────────────────────────────
-# Each --params entry is either a directory of *.json files, or a param file.
-param_files = []
-for params in args.params:
-    params_path = Path(params)
-    if params_path.is_dir():
-        found = sorted(params_path.glob("*.json"))
-        if not found:
-            raise FileNotFoundError(f"No *.json files found in {params_path}")
-        param_files += found
-    elif params_path.is_file():
-        param_files.append(params_path)
-    else:
-        raise FileNotFoundError(f"No such file or directory: {params_path}")
-print(f"Found {len(param_files)} param files: {[p.name for p in param_files]}")
 
-# Labels are the file stems (m4, m6, ...), unless two param files share the same
-# stem, in which case the paths are used to tell them apart.
-param_labels = [param_file.stem for param_file in param_files]
-if len(set(param_labels)) != len(param_labels):
-    param_labels = [str(param_file) for param_file in param_files]
+def rollouts_mujoco(
+    model,
+    logs: list,
+    reset_period: float | None = None,
+    threads: int | None = None,
+    stacked: bool = False,
+) -> list:
+    """Rollouts of a model over logs sharing the same dt, rolled out at once with
+    the MuJoCo (CPU) simulator, one environment per log, stepped on threads (or
+    all in a single stacked scene). Returns the ``(positions, velocities,
+    controls)`` of each log."""
+    # Imported lazily so the default (reference) backend doesn't require MuJoCo.
+    from bam import mujoco as mujoco_backend
 
+    simulator = mujoco_backend.Simulator(model, threads=threads, stacked=stacked)
+    return list(zip(*simulator.rollout_logs(logs, reset_period=reset_period)))
 
-# ── MAE computation ───────────────────────────────────────────────────────────
-def _mae(positions, log: dict) -> float:
-    log_positions = np.array([entry["position"] for entry in log["entries"]])
-    return float(np.mean(np.abs(np.array(positions) - log_positions)))
 
+def rollout_group(
+    model, group: Dataset, reset_period: float | None = None, numba=False
+):
+    """Rollouts of a model over a group of logs of the compiled dataset (see
+    group_by_dt), rolled out at once with the reference (or compiled) simulator.
+    Returns the ``(positions, velocities, controls)`` of each log, trimmed to its
+    length."""
+    if numba:
+        # Imported lazily so the default (reference) backend doesn't require Numba.
+        from bam import numba as numba_backend
 
-def compute_mae(model, log: dict) -> float:
-    if args.mujoco:
-        simulator = mujoco_backend.Simulator(model)
-        positions, _, _ = simulator.rollout_log(log, reset_period=args.reset_period)
+        simulator = numba_backend.Simulator(model)
     else:
         simulator = simulate.Simulator(model)
-        positions, _, _ = simulator.rollout_log(
-            log, reset_period=args.reset_period, simulate_control=True
-        )
-    return _mae(positions, log)
+
+    # (T x N) arrays, the padding steps are dropped
+    outputs = simulator.rollout_log(
+        group, reset_period=reset_period, simulate_control=True
+    )
+    outputs = [np.array(values, dtype=float) for values in outputs]
+    return [
+        tuple(values[:length, i] for values in outputs)
+        for i, length in enumerate(group.lengths)
+    ]
 
 
-def compute_maes_mjlab(param_file, all_logs: list) -> list:
-    """Vectorized MAEs for one param file over all logs, using the mjlab GPU backend.
+def rollouts_mjlab(
+    param_file, all_logs: list, reset_period: float | None = None
+) -> list:
+    """Vectorized rollouts for one param file over all logs, using the mjlab GPU
+    backend.
 
     Logs are grouped by ``dt`` (a batch must share a single MuJoCo timestep) and
     each group is rolled out in a single parallel ``rollout_logs`` call.
     """
+    # Imported lazily so other backends don't require mjlab.
+    from bam import mjlab as mjlab_backend
+
     simulator = mjlab_backend.Simulator(json_path=str(param_file))
     groups: dict[float, list[int]] = {}
     for i, log in enumerate(all_logs):
         groups.setdefault(log["dt"], []).append(i)
 
-    maes: list[float | None] = [None] * len(all_logs)
+    rollouts: list[tuple | None] = [None] * len(all_logs)
     for indices in groups.values():
         batch = [all_logs[i] for i in indices]
-        positions, _, _ = simulator.rollout_logs(batch, reset_period=args.reset_period)
+        positions, velocities, controls = simulator.rollout_logs(
+            batch, reset_period=reset_period
+        )
         for j, i in enumerate(indices):
-            maes[i] = _mae(positions[j], all_logs[i])
-    return maes
+            rollouts[i] = (positions[j], velocities[j], controls[j])
+    return rollouts
 
 
-results = {}  # name → list of per-log MAEs
+# Data shared by the rollout tasks of an evaluation (see evaluate()), set once in
+# each process of the pool rather than sent with every task
+evaluation = {}
 
-for param_file, label in zip(param_files, param_labels):
-    try:
-        model = load_model(str(param_file))
-    except Exception as e:
-        print(f"  {'[SKIP] ' + label:30s} ({e})")
-        continue
-    print(f"  {label:30s}", end="", flush=True)
 
-    if args.mjlab:
-        maes = compute_maes_mjlab(param_file, logs.logs)
-    else:
-        maes = [compute_mae(model, log) for log in logs.logs]
+def init_evaluation(data: dict):
+    evaluation.clear()
+    evaluation.update(data)
+
 
-    mean_mae = float(np.mean(maes))
-    std_mae = float(np.std(maes))
-    results[label] = {"mean": mean_mae, "std": std_mae, "per_log": maes}
-    print(f"MAE = {mean_mae * 1000:.2f} ± {std_mae * 1000:.2f} mrad")
+def evaluate_task(task: tuple) -> tuple:
+    """Rollout task of an evaluation: a param file on a group of logs of the
+    compiled dataset (reference, numba and mujoco backends). Returns the indices of
+    the logs and their rollouts."""
+    param_file, index = task
+    model = load_model(str(param_file))
+    reset_period = evaluation["reset_period"]
 
+    indices, group = evaluation["groups"][index]
+    if evaluation["backend"] == "mujoco":
+        logs = [evaluation["logs"][i] for i in indices]
+        return indices, rollouts_mujoco(
+            model, logs, reset_period, evaluation["threads"], evaluation["stacked"]
+        )
 
-# ── JSON output ───────────────────────────────────────────────────────────────
-if args.json is not None:
-    with open(args.json, "w") as f:
-        json.dump(results, f, indent=2)
-    print(f"Wrote results for {len(results)} models to {args.json}")
-    raise SystemExit(0)
+    numba = evaluation["backend"] == "numba"
+    return indices, rollout_group(model, group, reset_period, numba)
+
+
+def evaluate(
+    params: list[str],
+    logs: Logs,
+    reset_period: float | None = None,
+    backend: str = "reference",
+    jobs: int = 1,
+    cache: RolloutCache | None = None,
+    threads: int | None = None,
+    stacked: bool = False,
+) -> dict:
+    """MAEs of param files on logs.
+
+    :param params: Directories containing ``*.json`` param files, and/or param
+        files themselves.
+    :param logs: Logs to evaluate the param files on (compiled once for all the
+        param files).
+    :param reset_period: Reset period for simulation rollouts (s).
+    :param backend: Simulator backend, one of :data:`backends`.
+    :param jobs: Number of processes the rollouts are spread over (param files ×
+        groups of logs). The mjlab backend is vectorized over the logs already,
+        and runs in this process.
+    :param cache: Cache of the rollouts. Only the (param file, log) rollouts that
+        are not in the cache are simulated.
+    :param threads: With the mujoco backend, number of threads stepping the
+        environments (one per log) of a group of logs.
+    :param stacked: With the mujoco backend, simulate the logs of a group as
+        independent pendulums of a single scene, advanced by a single step.
+    :returns: A dict label → ``{"mean", "std", "per_log"}`` MAEs. The param files
+        that can't be loaded are skipped.
+    """
+    if backend not in backends:
+        raise ValueError(f"Unknown backend: {backend}")
+
+    param_files = find_param_files(params)
+    print(f"Found {len(param_files)} param files: {[p.name for p in param_files]}")
+
+    loaded = []
+    for param_file, label in zip(param_files, make_labels(param_files)):
+        try:
+            load_model(str(param_file))
+        except Exception as e:
+            print(f"  {'[SKIP] ' + label:30s} ({e})")
+            continue
+        loaded.append((param_file, label))
+
+    # Recorded positions, extracted once for all the param files
+    log_positions = [np.array(columns(log)["position"]) for log in logs.logs]
+
+    # Rollouts of each param file on each log, from the cache if possible
+    options = rollout_options(backend, reset_period, stacked)
+    rollouts = {label: [None] * len(logs.logs) for _, label in loaded}
+    if cache is not None:
+        for param_file, label in loaded:
+            for i, log in enumerate(logs.logs):
+                key = cache.key(param_file, log, backend, **options)
+                rollouts[label][i] = cache.get(key)
+
+    def missing(label, log_indices) -> bool:
+        return any(rollouts[label][i] is None for i in log_indices)
+
+    data = {
+        "backend": backend,
+        "reset_period": reset_period,
+        "threads": threads,
+        "stacked": stacked,
+    }
+    tasks, task_labels = [], []
+    if backend in ["reference", "numba", "mujoco"]:
+        # Groups are split further, so that all the processes have tasks
+        chunks = max(1, -(-jobs // max(1, len(loaded))))
+        groups = split_groups(group_by_dt(logs.compile()), chunks)
+        if backend == "mujoco":
+            # The MuJoCo simulator rolls out the log dicts
+            data["logs"] = logs.logs
+            groups = [(group_indices, None) for group_indices, _ in groups]
+        data["groups"] = groups
+        for param_file, label in loaded:
+            for index, (group_indices, _) in enumerate(groups):
+                if missing(label, group_indices):
+                    tasks.append((param_file, index))
+                    task_labels.append(label)
+
+    if backend == "mjlab":
+        for param_file, label in loaded:
+            if missing(label, range(len(logs.logs))):
+                tasks.append((param_file, None))
+                task_labels.append(label)
+        outputs = [
+            (range(len(logs.logs)), rollouts_mjlab(param_file, logs.logs, reset_period))
+            for param_file, _ in tasks
+        ]
+    elif jobs > 1 and len(tasks) > 1:
+        with multiprocessing.Pool(
+            min(jobs, len(tasks)), initializer=init_evaluation, initargs=(data,)
+        ) as pool:
+            outputs = pool.map(evaluate_task, tasks)
+    else:
+        init_evaluation(data)
+        outputs = [evaluate_task(task) for task in tasks]
+
+    for (param_file, _), label, (log_indices, task_rollouts) in zip(
+        tasks, task_labels, outputs
+    ):
+        for i, rollout in zip(log_indices, task_rollouts):
+            if cache is not None:
+                key = cache.key(param_file, logs.logs[i], backend, **options)
+                cache.put(key, *rollout)
+            rollouts[label][i] = rollout
+
+    results = {}  # name → list of per-log MAEs
+    for _, label in loaded:
+        maes = [
+            _mae(positions, log_positions[i])
+            for i, (positions, _, _) in enumerate(rollouts[label])
+        ]
+        mean_mae = float(np.mean(maes))
+        std_mae = float(np.std(maes))
+        results[label] = {"mean": mean_mae, "std": std_mae, "per_log": maes}
+        print(f"  {label:30s}MAE = {mean_mae * 1000:.2f} ± {std_mae * 1000:.2f} mrad")
+
+    return results
 
 
 # ── Box plot ──────────────────────────────────────────────────────────────────
-labels = list(results.keys())
-per_log = [np.array(results[k]["per_log"]) * 1000 for k in labels]  # → mrad
-means = np.array([results[k]["mean"] for k in labels]) * 1000
-medians = np.array([np.median(d) for d in per_log])
-
-if args.sort:
-    order = np.argsort(means)
-    labels = [labels[i] for i in order]
-    per_log = [per_log[i] for i in order]
-    means = means[order]
-    medians = medians[order]
-
-fig, ax = plt.subplots(figsize=(max(6, len(labels) * 0.9 + 1), 5))
-positions = np.arange(1, len(labels) + 1)
-bp = ax.boxplot(
-    per_log,
-    positions=positions,
-    widths=0.6,
-    showmeans=True,
-    meanline=True,
-    patch_artist=True,
-    medianprops=dict(color="black"),
-    meanprops=dict(color="firebrick", linestyle="--"),
-)
-for patch in bp["boxes"]:
-    patch.set_facecolor("steelblue")
-    patch.set_alpha(0.6)
-    patch.set_edgecolor("black")
-    patch.set_linewidth(0.7)
-
-# Custom annotation: median MAE next to each box, at the median line's level.
-for pos, median in zip(positions, medians):
-    ax.text(
-        pos + 0.35,
-        median,
-        f"{median:.1f}",
-        ha="left",
-        va="center",
-        fontsize=8,
-        color="black",
-    )
-
-ax.set_xticks(positions, labels)
-ax.set_ylabel("MAE [mrad]")
-ax.set_xlabel("Model")
-ax.set_title(f"Model comparison — {len(logs.logs)} logs from {Path(args.logdir).name}")
-ax.grid(axis="y", linestyle="--", alpha=0.5)
-plt.tight_layout()
-plt.show()
+def plot_results(results: dict, title: str, sort: bool = False):
+    labels = list(results.keys())
+    per_log = [np.array(results[k]["per_log"]) * 1000 for k in labels]  # → mrad
+    means = np.array([results[k]["mean"] for k in labels]) * 1000
+    medians = np.array([np.median(d) for d in per_log])
+
+    if sort:
+        order = np.argsort(means)
+        labels = [labels[i] for i in order]
+        per_log = [per_log[i] for i in order]
+        means = means[order]
+        medians = medians[order]
+
+    _, ax = plt.subplots(figsize=(max(6, len(labels) * 0.9 + 1), 5))
+    positions = np.arange(1, len(labels) + 1)
+    bp = ax.boxplot(
+        per_log,
+        positions=positions,
+        widths=0.6,
+        showmeans=True,
+        meanline=True,
+        patch_artist=True,
+        medianprops=dict(color="black"),
+        meanprops=dict(color="firebrick", linestyle="--"),
+    )
+    for patch in bp["boxes"]:
+        patch.set_facecolor("steelblue")
+        patch.set_alpha(0.6)
+        patch.set_edgecolor("black")
+        patch.set_linewidth(0.7)
+
+    # Custom annotation: median MAE next to each box, at the median line's level.
+    for pos, median in zip(positions, medians):
+        ax.text(
+            pos + 0.35,
+            median,
+            f"{median:.1f}",
+            ha="left",
+            va="center",
+            fontsize=8,
+            color="black",
+        )
+
+    ax.set_xticks(positions, labels)
+    ax.set_ylabel("MAE [mrad]")
+    ax.set_xlabel("Model")
+    ax.set_title(title)
+    ax.grid(axis="y", linestyle="--", alpha=0.5)
+    plt.tight_layout()
+    plt.show()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Compare BAM model MAEs")
+    arg_parser.add_argument(
+        "--params",
+        type=str,
+        required=True,
+        nargs="+",
+        help="Directories containing *.json param files, and/or param files themselves",
+    )
+    arg_parser.add_argument(
+        "--logdir", type=str, required=True, help="Directory containing log files"
+    )
+    arg_parser.add_argument(
+        "--reset_period",
+        type=float,
+        default=None,
+        help="Reset period for simulation rollouts (s)",
+    )
+    arg_parser.add_argument(
+        "--sort",
+        action="store_true",
+        default=False,
+        help="Sort bars by MAE (default: keep evaluation order)",
+    )
+    arg_parser.add_argument("--no-sort", dest="sort", action="store_false")
+    arg_parser.add_argument(
+        "--json",
+        type=str,
+        default=None,
+        help="Write results to this JSON file instead of plotting",
+    )
+    arg_parser.add_argument(
+        "--mujoco",
+        action="store_true",
+        help="Use the MuJoCo (CPU) simulator backend instead of the reference one",
+    )
+    arg_parser.add_argument(
+        "--mjlab",
+        action="store_true",
+        help="Use the mjlab (MuJoCo Warp / GPU) simulator backend, vectorized over "
+        "all logs",
+    )
+    arg_parser.add_argument(
+        "--numba",
+        action="store_true",
+        help="Use the compiled (Numba) version of the reference simulator backend",
+    )
+    arg_parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of processes the rollouts are spread over",
+    )
+    arg_parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="With --mujoco, number of threads stepping the environments (one per "
+        "log) of each batch of logs",
+    )
+    arg_parser.add_argument(
+        "--stacked",
+        action="store_true",
+        help="With --mujoco, simulate each batch of logs as independent pendulums of "
+        "a single scene, advanced by a single mj_step",
+    )
+    arg_parser.add_argument(
+        "--cache",
+        type=str,
+        default=None,
+        help="Directory of the rollouts cache (default: ~/.cache/bam/rollouts)",
+    )
+    arg_parser.add_argument(
+        "--no-cache",
+        dest="no_cache",
+        action="store_true",
+        help="Simulate all the rollouts, without reading nor writing the cache",
+    )
+    args = arg_parser.parse_args()
+
+    backend = "reference"
+    if args.numba:
+        backend = "numba"
+    if args.mujoco:
+        backend = "mujoco"
+    if args.mjlab:
+        backend = "mjlab"
+
+    # ── Load logs ─────────────────────────────────────────────────────────────
+    logs = Logs(args.logdir)
+    print(f"Loaded {len(logs.logs)} logs from {args.logdir}")
+
+    cache = None if args.no_cache else RolloutCache(args.cache)
+    results = evaluate(
+        args.params,
+        logs,
+        args.reset_period,
+        backend,
+        args.jobs,
+        cache,
+        args.threads,
+        args.stacked,
+    )
+
+    # ── JSON output ───────────────────────────────────────────────────────────
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote results for {len(results)} models to {args.json}")
+        raise SystemExit(0)
+
+    plot_results(
+        results,
+        f"Model comparison — {len(logs.logs)} logs from {Path(args.logdir).name}",
+        args.sort,
+    )
@@ -50,6 +50,7 @@ from mjlab.managers.event_manager import RecomputeLevel, requires_model_fields
 
 from .actuator import TorchBackend, VoltageControlledActuator
 from .model import Model, load_model, _resolve_json_path
+from .simulate import OUTPUTS
 from .testbench_mujoco import Pendulum
 
 if TYPE_CHECKING:
@@ -776,19 +777,23 @@ class Simulator:
 
     # ── Public API (mirrors the reference / CPU simulators) ──────────────────
 
-    def rollout_log(self, log: dict, reset_period: float | None = None) -> tuple:
+    def rollout_log(
+        self, log: dict, reset_period: float | None = None, outputs: tuple = OUTPUTS
+    ) -> tuple:
         """Roll out a single log. See :meth:`rollout_logs`.
 
-        :returns: Tuple ``(positions, velocities, controls)`` — lists over timesteps.
+        :returns: Tuple of the requested outputs (by default ``(positions,
+            velocities, controls)``) — arrays over timesteps.
         """
-        positions, velocities, controls = self.rollout_logs(
-            [log], reset_period=reset_period
-        )
-        return positions[0], velocities[0], controls[0]
+        results = self.rollout_logs([log], reset_period=reset_period, outputs=outputs)
+        return tuple(result[0] for result in results)
 
     def rollout_logs(
-        self, logs: list[dict], reset_period: float | None = None
-    ) -> tuple[list, list, list]:
+        self,
+        logs: list[dict],
+        reset_period: float | None = None,
+        outputs: tuple = OUTPUTS,
+    ) -> tuple:
         """Roll out a batch of logs in parallel — one environment per log.
 
         All logs must share the same timestep ``dt`` (a single MuJoCo timestep is
@@ -800,13 +805,16 @@ class Simulator:
         :param logs: List of processed log dicts.
         :param reset_period: If set, re-synchronize each environment's state to its
             log at this interval [s] (mirrors the reference simulator).
-        :returns: Tuple ``(positions, velocities, controls)`` — each a list (one
-            entry per log) of per-timestep values. ``controls`` are the applied
-            joint torques [Nm] (the BAM actuator drives MuJoCo in motor mode).
+        :param outputs: Outputs to return, among ``"positions"``, ``"velocities"``
+            and ``"controls"``. Only these are copied back from the device.
+        :returns: Tuple of the requested outputs (by default ``(positions,
+            velocities, controls)``) — each a list (one entry per log) of
+            per-timestep arrays. ``controls`` are the applied joint torques [Nm]
+            (the BAM actuator drives MuJoCo in motor mode).
         """
         n = len(logs)
         if n == 0:
-            return [], [], []
+            return tuple([] for _ in outputs)
 
         dts = {log["dt"] for log in logs}
         if len(dts) != 1:
@@ -860,9 +868,8 @@ class Simulator:
 
         ctrl_ids = bam_act.ctrl_ids
 
-        positions = np.zeros((max_len, n))
-        velocities = np.zeros((max_len, n))
-        controls = np.zeros((max_len, n))
+        # Preallocated (steps x environments) outputs
+        arrays = {output: np.zeros((max_len, n)) for output in outputs}
 
         reset_t = 0.0
         for k in range(max_len):
@@ -875,8 +882,12 @@ class Simulator:
                 entity.write_joint_state_to_sim(pk, vk)
                 sim.forward()
 
-            positions[k] = entity.data.joint_pos[:, 0].detach().cpu().numpy()
-            velocities[k] = entity.data.joint_vel[:, 0].detach().cpu().numpy()
+            if "positions" in arrays:
+                positions = entity.data.joint_pos[:, 0]
+                arrays["positions"][k] = positions.detach().cpu().numpy()
+            if "velocities" in arrays:
+                velocities = entity.data.joint_vel[:, 0]
+                arrays["velocities"][k] = velocities.detach().cpu().numpy()
 
             goal = torch.as_tensor(goals[k], dtype=f32, device=dev).unsqueeze(1)
             entity.set_joint_position_target(goal)
@@ -892,16 +903,17 @@ class Simulator:
                 )
                 entity.write_ctrl_to_sim(zeros, env_ids=off_ids)
 
-            controls[k] = sim.data.ctrl[:, ctrl_ids][:, 0].detach().cpu().numpy()
+            if "controls" in arrays:
+                controls = sim.data.ctrl[:, ctrl_ids][:, 0]
+                arrays["controls"][k] = controls.detach().cpu().numpy()
 
             sim.step()
             scene.update(dt=dt)
 
         # ── Trim each environment's output back to its own length ────────────
-        out_pos = [list(positions[: lengths[i], i]) for i in range(n)]
-        out_vel = [list(velocities[: lengths[i], i]) for i in range(n)]
-        out_ctrl = [list(controls[: lengths[i], i]) for i in range(n)]
-        return out_pos, out_vel, out_ctrl
+        return tuple(
+            [arrays[output][: lengths[i], i] for i in range(n)] for output in outputs
+        )
 
     # ── Internals ────────────────────────────────────────────────────────────
 
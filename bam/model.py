@@ -58,6 +58,9 @@ class Model:
         self.max_load_friction = 0.5
         self.max_viscous_friction = 1.0
 
+        # Number of parameter sets simulated at once (see set_parameters_batch)
+        self.parameters_batch_size: int | None = None
+
     def reset(self) -> None:
         """
         Resets the model internal state
@@ -128,61 +131,70 @@ class Model:
         :returns: Tuple ``(frictionloss, damping)`` ready to be written into
             ``mj_model.dof_frictionloss`` and ``mj_model.dof_damping``.
         """
+        # Shares the array backend of the actuator (numpy or torch)
+        backend = self.actuator.backend
+
         # Torque applied to the gearbox
         if self.directional:
-            gearbox_torque = np.abs(
+            gearbox_torque = abs(
                 external_torque * self.load_friction_external.value
                 - motor_torque * self.load_friction_motor.value
             )
             if self.stribeck:
-                gearbox_torque_stribeck = np.abs(
+                gearbox_torque_stribeck = abs(
                     external_torque * self.load_friction_external_stribeck.value
                     - motor_torque * self.load_friction_motor_stribeck.value
                 )
         else:
-            gearbox_torque = np.abs(external_torque - motor_torque)
+            gearbox_torque = abs(external_torque - motor_torque)
 
         if self.stribeck:
             # Stribeck coeff (1 when stopped to 0 when moving)
-            stribeck_coeff = np.exp(
-                -(np.abs(dtheta / self.dtheta_stribeck.value) ** self.alpha.value)
+            stribeck_coeff = backend.exp(
+                -(abs(dtheta / self.dtheta_stribeck.value) ** self.alpha.value)
             )
 
-        # Static friction
+        # Static friction (not updated in place, parameters can be arrays)
         frictionloss = self.friction_base.value
         if self.load_dependent:
             if self.directional:
-                frictionloss += gearbox_torque
+                frictionloss = frictionloss + gearbox_torque
             else:
-                frictionloss += self.load_friction_base.value * gearbox_torque
+                frictionloss = (
+                    frictionloss + self.load_friction_base.value * gearbox_torque
+                )
 
         if self.stribeck:
-            frictionloss += stribeck_coeff * self.friction_stribeck.value
+            frictionloss = frictionloss + stribeck_coeff * self.friction_stribeck.value
 
             if self.load_dependent:
                 if self.directional:
-                    frictionloss += gearbox_torque_stribeck * stribeck_coeff
+                    frictionloss = (
+                        frictionloss + gearbox_torque_stribeck * stribeck_coeff
+                    )
                 else:
-                    frictionloss += (
+                    frictionloss = frictionloss + (
                         self.load_friction_stribeck.value
                         * gearbox_torque
                         * stribeck_coeff
                     )
 
                 if self.quadratic:
-                    enable_quadratic = np.sign(external_torque) != np.sign(motor_torque)
-                    direction_motor = np.abs(external_torque) < np.abs(motor_torque)
-                    direction_external = np.abs(external_torque) > np.abs(motor_torque)
+                    enable_quadratic = backend.sign(external_torque) != backend.sign(
+                        motor_torque
+                    )
+                    direction_motor = abs(external_torque) < abs(motor_torque)
+                    direction_external = abs(external_torque) > abs(motor_torque)
 
                     gearbox_torque2_motor = (
                         self.load_friction_external_quad.value
-                        * np.abs(external_torque) ** 2
+                        * abs(external_torque) ** 2
                     )
                     gearbox_torque2_external = (
-                        self.load_friction_motor_quad.value * np.abs(motor_torque) ** 2
+                        self.load_friction_motor_quad.value * abs(motor_torque) ** 2
                     )
 
-                    frictionloss += (
+                    frictionloss = frictionloss + (
                         stribeck_coeff
                         * (
                             direction_motor * gearbox_torque2_motor
@@ -218,6 +230,38 @@ class Model:
                 x[name] = parameter.value
         return x
 
+    def set_parameters_batch(self, values: dict) -> None:
+        """Turn every parameter into a vector of candidate values.
+
+        All the parameters (including the actuator ones, e.g. ``kt``, ``R`` or
+        ``armature``) become column vectors of shape ``(P, 1)``, so that they
+        broadcast against a log batch of shape ``(N,)``. The simulator then rolls
+        out the P parameter sets over the N logs in a single time loop (see
+        :meth:`bam.simulate.Simulator.rollout_batch`).
+
+        :param values: Dict mapping parameter names to P values (or to a scalar,
+            shared by all the candidates). Parameters that are not given keep
+            their current value for all the candidates.
+        """
+        sizes = {np.size(value) for value in values.values()} - {1}
+        if len(sizes) > 1:
+            raise ValueError(f"Inconsistent parameters batch sizes: {sorted(sizes)}")
+        batch_size = sizes.pop() if sizes else 1
+
+        parameters = self.get_parameters()
+        for name in values:
+            if name not in parameters:
+                raise KeyError(f"Unknown parameter: {name}")
+
+        for name, parameter in parameters.items():
+            value = values.get(name, parameter.value)
+            value = np.broadcast_to(
+                np.ravel(np.asarray(value, dtype=float)), batch_size
+            )
+            parameter.value = value.reshape(batch_size, 1).copy()
+
+        self.parameters_batch_size = batch_size
+
     def load_parameters(self, json_file: str) -> list:
         """
         Load parameters from a given filename
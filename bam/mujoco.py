@@ -6,11 +6,14 @@
 
 #     http://www.apache.org/licenses/LICENSE-2.0
 
+import copy
+import functools
 import numpy as np
 import mujoco
 import json
-from copy import copy
 from .model import Model, load_model_from_dict
+from .logs import Dataset
+from .simulate import OUTPUTS
 from .testbench_mujoco import Pendulum
 
 
@@ -42,19 +45,32 @@ class MujocoController:
         vin_min: float | None = None,
     ):
         self.model = model
-        self.actuator = np.atleast_1d(actuator)
         self.mujoco_model = mujoco_model
         self.mujoco_data = mujoco_data
         self.vin_drop_resistance = vin_drop_resistance
         self.vin_min = vin_min
+        self._set_actuator(actuator)
 
+        # Setting the armature
+        self.mujoco_model.dof_armature[self.dof_indexes] = (
+            model.actuator.get_extra_inertia()
+        )
+        mujoco.mj_setConst(self.mujoco_model, self.mujoco_data)
+
+    def _set_actuator(self, actuator: str):
+        """
+        Sets the controlled actuator(s), and their indexes in the MuJoCo arrays
+        """
+        self.actuator = np.atleast_1d(actuator)
         self.dofs = []
         self.q_target = np.zeros(len(self.actuator))
         self.dof_to_q_target = {}
         for i, name in enumerate(self.actuator):
             self.dof_to_q_target[name] = i
 
-        self.last_ts = mujoco_data.time
+        self.last_ts = self.mujoco_data.time
+        # Last computed control signal
+        self.control = None
 
         # Actuator indexes (ctrl)
         self.act_indexes = [
@@ -68,12 +84,9 @@ class MujocoController:
         # Qpos indexes (qpos)
         self.qpos_indexes = self.mujoco_model.jnt_qposadr[self.joint_indexes]
         self.dof_indexes = self.mujoco_model.jnt_dofadr[self.joint_indexes]
-
-        # Setting the armature
-        self.mujoco_model.dof_armature[self.dof_indexes] = (
-            model.actuator.get_extra_inertia()
-        )
-        mujoco.mj_setConst(self.mujoco_model, self.mujoco_data)
+        # Actuator of each DOF (-1 for the DOFs that are not controlled)
+        self.dof_actuators = np.full(self.mujoco_model.nv, -1)
+        self.dof_actuators[self.dof_indexes] = np.arange(len(self.actuator))
 
     def get_q_target(self, name: str) -> float:
         """Return the current target position for a named actuator [rad].
@@ -90,12 +103,15 @@ class MujocoController:
         """
         self.q_target[self.dof_to_q_target[name]] = q_target
 
-    def update(self):
+    def update(self, dt: float | None = None):
         """
         Update the controlled actuator(s) data:
         - Torque to apply
         - Friction parameters
         - Damping
+
+        :param dt: Timestep of the control update [s], by default the simulation
+            time elapsed since the last update.
         """
         q = self.mujoco_data.qpos[self.qpos_indexes]
         dq = self.mujoco_data.qvel[self.dof_indexes]
@@ -124,9 +140,11 @@ class MujocoController:
 
         # Computing the control signal (when the actuator defines a max_current,
         # the firmware current limiter is applied here as a duty-cycle constraint)
-        dt = self.mujoco_data.time - self.last_ts
+        if dt is None:
+            dt = self.mujoco_data.time - self.last_ts
         self.last_ts = self.mujoco_data.time
         control = act.compute_control(self.q_target, q, dq, dt)
+        self.control = control
 
         # Computing the applied torque
         torque = act.compute_torque(control, True, q, dq)
@@ -144,24 +162,7 @@ class MujocoController:
             + self.mujoco_data.qfrc_constraint[self.dof_indexes]
         )
 
-        # Repeats the ids (now N_id x N_efc)
-        efc_id_repeated = np.repeat(
-            [self.mujoco_data.efc_id], len(self.actuator), axis=0
-        )
-        # Repeat the indexes (now N_id x N_efc)
-        id_repeated = np.repeat(
-            [self.joint_indexes], len(self.mujoco_data.efc_id), axis=0
-        ).T
-        # Do the batched test (element wise)
-        selector = efc_id_repeated == id_repeated
-        # Use * as a logical and
-        selector = selector * (
-            self.mujoco_data.efc_type == mujoco.mjtConstraint.mjCNSTR_FRICTION_DOF.value
-        )
-        # Sum the forces
-        friction_force = np.sum(self.mujoco_data.efc_force * selector, axis=1)
-
-        torque_external -= friction_force
+        torque_external -= self._dof_friction_force()
         torque_actuator = self.mujoco_data.qfrc_actuator[self.dof_indexes]
 
         # Updating friction parameters
@@ -173,53 +174,316 @@ class MujocoController:
         self.mujoco_model.dof_frictionloss[self.dof_indexes] = frictionloss
         self.mujoco_model.dof_damping[self.dof_indexes] = damping
 
+    def _dof_friction_force(self) -> np.ndarray:
+        """
+        Force of the friction constraint (frictionloss) of each controlled DOF.
+
+        The constraint rows are sorted by type: the nf friction rows come right
+        after the ne equality ones, before the limits and (many) contacts rows, so
+        only them are read. The DOF friction rows reference their DOF in efc_id,
+        from which the forces are summed per actuator in a single pass
+        """
+        data = self.mujoco_data
+        rows = slice(data.ne, data.ne + data.nf)
+        dof_rows = (
+            data.efc_type[rows] == mujoco.mjtConstraint.mjCNSTR_FRICTION_DOF.value
+        )
+        actuators = self.dof_actuators[data.efc_id[rows][dof_rows]]
+
+        # The DOFs that are not controlled (-1) are summed in the discarded bin 0
+        return np.bincount(
+            actuators + 1,
+            weights=data.efc_force[rows][dof_rows],
+            minlength=len(self.actuator) + 1,
+        )[1:]
+
+
+def stack_models(models: list, sizes: list) -> Model:
+    """
+    Stacks models sharing the same actuator class and friction terms (m1–m6 feature
+    flags) in a single model, whose parameters (and numeric actuator settings, e.g.
+    ``kp``, ``error_gain`` or ``max_pwm``) are per-DOF arrays.
+
+    :param list models: Models to stack
+    :param list sizes: Number of DOFs controlled with each model
+    :returns: The stacked model, where the DOFs of each model are consecutive
+    """
+    first = models[0]
+    model = Model(
+        load_dependent=first.load_dependent,
+        directional=first.directional,
+        stribeck=first.stribeck,
+        quadratic=first.quadratic,
+        name=first.name,
+        title=first.title,
+    )
+    model.set_actuator(copy.copy(first.actuator))
+    model.actuator_name = first.actuator_name
+
+    def stacked(values: list) -> np.ndarray:
+        return np.repeat(np.asarray(values, dtype=float), sizes)
+
+    for name, parameter in model.get_parameters().items():
+        parameter.value = stacked([m.get_parameters()[name].value for m in models])
+    for name, value in vars(first.actuator).items():
+        if isinstance(value, (int, float, np.ndarray)) and not isinstance(value, bool):
+            setattr(
+                model.actuator,
+                name,
+                stacked([getattr(m.actuator, name) for m in models]),
+            )
+
+    return model
+
+
+class FusedMujocoController(MujocoController):
+    """
+    A MujocoController for the joints of several models (e.g. all the groups of
+    a :func:`load_config` file), updated together in a single vectorized pass.
+
+    The models sharing the same actuator class and friction terms (m1–m6 feature
+    flags) are stacked in a single model with per-DOF parameters (see
+    :func:`stack_models`), so a robot whose joints are all identified with the
+    same model variant computes the control and the frictions of all its joints
+    at once, however many motor types it has.
+
+    :param list models: List of ``(model, actuators)`` pairs, the actuators being
+        the names of the actuators controlled with the model
+    :param mujoco.MjModel mujoco_model: The mujoco model
+    :param mujoco.MjData mujoco_data: The mujoco data
+    :param float | None vin_drop_resistance: See :class:`MujocoController`. The
+        current is summed over all the controlled joints, which share the supply.
+    :param float | None vin_min: See :class:`MujocoController`
+    """
+
+    def __init__(
+        self,
+        models: list,
+        mujoco_model: mujoco.MjModel,
+        mujoco_data: mujoco.MjData,
+        vin_drop_resistance: float | None = None,
+        vin_min: float | None = None,
+    ):
+        self.mujoco_model = mujoco_model
+        self.mujoco_data = mujoco_data
+        self.vin_drop_resistance = vin_drop_resistance
+        self.vin_min = vin_min
+
+        # Grouping the models by actuator class and friction terms
+        groups = {}
+        for model, actuator in models:
+            key = (
+                type(model.actuator),
+                model.load_dependent,
+                model.directional,
+                model.stribeck,
+                model.quadratic,
+            )
+            groups.setdefault(key, []).append((model, list(np.atleast_1d(actuator))))
+
+        # Stacked model of each group, and the slice of its actuators
+        self.groups = []
+        actuator_names = []
+        for group in groups.values():
+            model = stack_models(
+                [model for model, _ in group], [len(names) for _, names in group]
+            )
+            start = len(actuator_names)
+            for _, names in group:
+                actuator_names += names
+            self.groups.append((model, slice(start, len(actuator_names))))
+        self._set_actuator(actuator_names)
+
+        # Setting the armature
+        for model, actuators in self.groups:
+            self.mujoco_model.dof_armature[self.dof_indexes[actuators]] = (
+                model.actuator.get_extra_inertia()
+            )
+        mujoco.mj_setConst(self.mujoco_model, self.mujoco_data)
+
+    @property
+    def models(self) -> list:
+        """Stacked models, one per group of actuator class and friction terms"""
+        return [model for model, _ in self.groups]
+
+    def update(self, dt: float | None = None):
+        """
+        Update all the controlled actuators data (see
+        :meth:`MujocoController.update`)
+        """
+        q = self.mujoco_data.qpos[self.qpos_indexes]
+        dq = self.mujoco_data.qvel[self.dof_indexes]
+        torque_actuator = self.mujoco_data.qfrc_actuator[self.dof_indexes]
+        torque_external = (
+            -self.mujoco_data.qfrc_bias[self.dof_indexes]
+            + self.mujoco_data.qfrc_constraint[self.dof_indexes]
+            - self._dof_friction_force()
+        )
+
+        # Battery current, summed over all the joints (see MujocoController)
+        current = None
+        if self.vin_drop_resistance is not None:
+            current = 0.0
+            for model, actuators in self.groups:
+                duty_cycle = getattr(model.actuator, "duty_cycle", None)
+                if duty_cycle is not None:
+                    current += np.sum(
+                        duty_cycle * torque_actuator[actuators] / model.kt.value
+                    )
+            current = max(current, 0.0)
+
+        if dt is None:
+            dt = self.mujoco_data.time - self.last_ts
+        self.last_ts = self.mujoco_data.time
+
+        control = np.empty(len(self.actuator))
+        torque = np.empty(len(self.actuator))
+        frictionloss = np.empty(len(self.actuator))
+        damping = np.empty(len(self.actuator))
+        for model, actuators in self.groups:
+            act = model.actuator
+            vin_orig = act.vin
+            if current is not None:
+                vin_eff = vin_orig - self.vin_drop_resistance * current
+                if self.vin_min is not None:
+                    vin_eff = np.maximum(vin_eff, self.vin_min)
+                act.vin = vin_eff
+
+            control[actuators] = act.compute_control(
+                self.q_target[actuators], q[actuators], dq[actuators], dt
+            )
+            torque[actuators] = act.compute_torque(
+                control[actuators], True, q[actuators], dq[actuators]
+            )
+            act.vin = vin_orig
+
+            frictionloss[actuators], damping[actuators] = model.compute_frictions(
+                torque_actuator[actuators], torque_external[actuators], dq[actuators]
+            )
+        self.control = control
+
+        self.mujoco_data.ctrl[self.act_indexes] = torque
+        self.mujoco_model.dof_frictionloss[self.dof_indexes] = frictionloss
+        self.mujoco_model.dof_damping[self.dof_indexes] = damping
+
+
+@functools.lru_cache(maxsize=64)
+def compile_pendulum(
+    mass: float | tuple,
+    arm_mass: float | tuple,
+    length: float | tuple,
+    name: str = "pendulum",
+) -> mujoco.MjModel:
+    """
+    Compiled model of a :class:`bam.testbench_mujoco.Pendulum` (cached, since
+    compiling a spec costs much more than a step). The controllers write to their
+    model (armature, frictions), so the result must be copied before use.
+
+    :param float | tuple mass: Tip mass [kg]
+    :param float | tuple arm_mass: Arm mass [kg]
+    :param float | tuple length: Arm length [m]
+    :param str name: Name of the hinge joint and of the motor actuator
+    :returns: The compiled model, of stacked pendulums if the parameters are
+        tuples (see :meth:`bam.testbench_mujoco.Pendulum.build_spec`)
+    """
+    if isinstance(mass, tuple):
+        mass, arm_mass, length = np.array(mass), np.array(arm_mass), np.array(length)
+    pendulum = Pendulum({"mass": mass, "arm_mass": arm_mass, "length": length})
+    return pendulum.build_spec(name).compile()
+
 
 class Simulator:
     """MuJoCo mirror of :class:`bam.simulate.Simulator`.
 
     Rolls out a BAM model against the same testbench, but uses MuJoCo physics
     (from :class:`bam.testbench_mujoco.Pendulum`) instead of the hand-written
-    Euler integrator, with the actuator driven by a :class:`MujocoController`.
-
-    Vectorization is handled the naive way: one independent ``(MjModel, MjData,
-    MujocoController)`` triplet is created per environment and they are ticked
-    one by one. This is intentionally not efficient — the point of this
-    simulator is to validate that the MuJoCo spec and the controller reproduce
-    the reference simulation.
+    Euler integrator, with the actuator driven as by a :class:`MujocoController`.
+
+    One independent ``(MjModel, MjData, MujocoController)`` triplet is created per
+    environment. At each step, the control and the frictions of all the
+    environments are computed in a single vectorized pass (the computation of
+    :meth:`MujocoController.update`), then the environments are stepped, either
+    one by one or concurrently on a pool of ``threads`` (``mj_step`` releases the
+    GIL). The environments can share a testbench (:meth:`reset`) or each have the
+    one of its log (:meth:`rollout_logs`).
+
+    With ``stacked``, all the environments are instead independent pendulums of a
+    single scene (see :meth:`bam.testbench_mujoco.Pendulum.build_spec`), driven
+    by a single :class:`MujocoController`, so that one ``mj_step`` advances the
+    whole batch. The constraint solver then handles the pendulums together, so
+    the trajectories match the separate environments up to its tolerance.
+
+    The compiled models are cached per testbench (see :func:`compile_pendulum`),
+    and the environments are reset in place as long as the testbenches and their
+    number don't change, so that frequent resets (``reset_period``) stay cheap.
 
     :param model: BAM friction model to simulate.
     :param actuator: Name used for the hinge joint and the motor actuator in
         the generated spec (and the name the :class:`MujocoController` controls).
+    :param threads: Number of threads stepping the environments (None or 1 steps
+        them one by one in the calling thread).
+    :param stacked: Simulate all the environments in a single scene.
     """
 
-    def __init__(self, model: Model, actuator: str = "pendulum"):
+    def __init__(
+        self,
+        model: Model,
+        actuator: str = "pendulum",
+        threads: int | None = None,
+        stacked: bool = False,
+    ):
         self.model = model
         self.actuator = actuator
-        # One entry per environment: (mujoco_model, mujoco_data, controller)
+        self.threads = threads
+        self.stacked = stacked
+        # One entry per scene (environment, or all of them if stacked):
+        # (mujoco_model, mujoco_data, controller), and the environments of each
         self.instances: list[tuple] = []
+        self.envs: list[slice] = []
+        # Compiled models the environments were built from
+        self.compiled_models: list[mujoco.MjModel] = []
+        # Environments stepped by each thread, and the threads pool
+        self.chunks: list[list[tuple]] = []
+        self.executor = None
+        # Last computed control signals
+        self.control = None
         self.t = 0.0
 
-    def _build_spec(self) -> mujoco.MjSpec:
+    def _compile(self, n: int) -> list:
+        """Compiled models of the n environments (or of the single scene stacking
+        them), the testbench parameters can be scalars (shared) or per-environment
+        arrays"""
         testbench = self.model.actuator.testbench
         if testbench is None:
             raise RuntimeError(
                 "No testbench set on the actuator. Call model.actuator.load_log(log) "
                 "(or set model.actuator.testbench) before building the simulator."
             )
-        pendulum = Pendulum(
-            {
-                "mass": testbench.mass,
-                "arm_mass": testbench.arm_mass,
-                "length": testbench.length,
-            }
+        mass, arm_mass, length = (
+            np.broadcast_to(value, (n,))
+            for value in (testbench.mass, testbench.arm_mass, testbench.length)
         )
-        return pendulum.build_spec(self.actuator)
+        if self.stacked:
+            parameters = (mass, arm_mass, length)
+            return [
+                compile_pendulum(
+                    *(tuple(float(x) for x in value) for value in parameters),
+                    self.actuator,
+                )
+            ]
+        return [
+            compile_pendulum(
+                float(mass[i]), float(arm_mass[i]), float(length[i]), self.actuator
+            )
+            for i in range(n)
+        ]
 
     def reset(self, q: float = 0.0, dq: float = 0.0):
         """(Re)build the environments and reset them to a given state.
 
         ``q`` and ``dq`` may be scalars or arrays; the number of environments is
-        the length of the (broadcast) inputs.
+        the length of the (broadcast) inputs. The environments are only rebuilt
+        when their number or the testbench changes, else they are reset in place.
 
         :param q: Initial joint angle(s) [rad].
         :param dq: Initial joint velocity(ies) [rad/s].
@@ -231,22 +495,51 @@ class Simulator:
         dq = np.broadcast_to(dq, (n,))
 
         self.model.reset()
-        spec = self._build_spec()
-
-        self.instances = []
-        for i in range(n):
-            mujoco_model = spec.compile()
-            mujoco_data = mujoco.MjData(mujoco_model)
-            controller = MujocoController(
-                self.model, self.actuator, mujoco_model, mujoco_data
-            )
-            mujoco_data.qpos[controller.qpos_indexes] = q[i]
-            mujoco_data.qvel[controller.dof_indexes] = dq[i]
+        compiled_models = self._compile(n)
+
+        if len(compiled_models) != len(self.compiled_models) or any(
+            a is not b for a, b in zip(compiled_models, self.compiled_models)
+        ):
+            self.compiled_models = compiled_models
+            self.instances = []
+            for compiled_model in compiled_models:
+                mujoco_model = copy.copy(compiled_model)
+                mujoco_data = mujoco.MjData(mujoco_model)
+                # Hinge of each environment of the scene
+                joints = [mujoco_model.joint(i).name for i in range(mujoco_model.njnt)]
+                controller = MujocoController(
+                    self.model, joints, mujoco_model, mujoco_data
+                )
+                self.instances.append((mujoco_model, mujoco_data, controller))
+            if self.stacked:
+                self.envs = [slice(0, n)]
+            else:
+                self.envs = [slice(i, i + 1) for i in range(n)]
+            threads = min(self.threads or 1, len(self.instances))
+            self.chunks = [self.instances[i::threads] for i in range(threads)]
+        else:
+            armature = self.model.actuator.get_extra_inertia()
+            for (mujoco_model, mujoco_data, controller), compiled_model in zip(
+                self.instances, compiled_models
+            ):
+                mujoco.mj_resetData(mujoco_model, mujoco_data)
+                # Frictions as compiled, armature of the (possibly updated) model
+                mujoco_model.dof_frictionloss[:] = compiled_model.dof_frictionloss
+                mujoco_model.dof_damping[:] = compiled_model.dof_damping
+                dofs = controller.dof_indexes
+                if np.any(mujoco_model.dof_armature[dofs] != armature):
+                    mujoco_model.dof_armature[dofs] = armature
+                    mujoco.mj_setConst(mujoco_model, mujoco_data)
+
+        for (mujoco_model, mujoco_data, controller), envs in zip(
+            self.instances, self.envs
+        ):
+            mujoco_data.qpos[controller.qpos_indexes] = q[envs]
+            mujoco_data.qvel[controller.dof_indexes] = dq[envs]
             mujoco.mj_forward(mujoco_model, mujoco_data)
-            # Seed the target with the initial position so the arm starts at rest
-            controller.q_target = mujoco_data.qpos[controller.qpos_indexes]
-            self.instances.append((mujoco_model, mujoco_data, controller))
+            controller.last_ts = mujoco_data.time
 
+        self.control = None
         self.t = 0.0
 
     def _pack(self, values: list):
@@ -259,23 +552,82 @@ class Simulator:
     def q(self):
         """Current joint angle(s) [rad] (scalar if a single environment)."""
         return self._pack(
-            [data.qpos[ctrl.qpos_indexes][0] for _, data, ctrl in self.instances]
+            np.concatenate(
+                [data.qpos[ctrl.qpos_indexes] for _, data, ctrl in self.instances]
+            )
         )
 
     @property
     def dq(self):
         """Current joint velocity(ies) [rad/s] (scalar if a single environment)."""
         return self._pack(
-            [data.qvel[ctrl.dof_indexes][0] for _, data, ctrl in self.instances]
+            np.concatenate(
+                [data.qvel[ctrl.dof_indexes] for _, data, ctrl in self.instances]
+            )
         )
 
+    def update(self, goal_position, torque_enable, dt: float):
+        """Update the controls and frictions of all the environments at once.
+
+        Same computation as :meth:`MujocoController.update`, vectorized over the
+        environments: their states are gathered, the control, torque and
+        frictions are computed in one pass, then written back.
+
+        :param goal_position: Target joint angle(s) [rad], scalar or per-environment.
+        :param torque_enable: Whether the actuator is powered (scalar or per-env).
+        :param dt: Timestep of the control update [s].
+        """
+        if self.stacked:
+            # The controller of the scene drives all the environments
+            _, mujoco_data, controller = self.instances[0]
+            n = len(controller.actuator)
+            controller.q_target = np.broadcast_to(goal_position, (n,))
+            controller.update(dt)
+            disabled = ~np.broadcast_to(np.asarray(torque_enable, dtype=bool), (n,))
+            mujoco_data.ctrl[np.asarray(controller.act_indexes)[disabled]] = 0.0
+            self.control = np.broadcast_to(controller.control, (n,))
+            return
+
+        n = len(self.instances)
+        q, dq, torque_actuator, torque_external = (np.empty(n) for _ in range(4))
+        for i, (_, mujoco_data, controller) in enumerate(self.instances):
+            dof = controller.dof_indexes[0]
+            q[i] = mujoco_data.qpos[controller.qpos_indexes[0]]
+            dq[i] = mujoco_data.qvel[dof]
+            torque_actuator[i] = mujoco_data.qfrc_actuator[dof]
+            torque_external[i] = (
+                -mujoco_data.qfrc_bias[dof] + mujoco_data.qfrc_constraint[dof]
+            ) - controller._dof_friction_force()[0]
+
+        act = self.model.actuator
+        control = act.compute_control(goal_position, q, dq, dt)
+        torque = act.compute_torque(control, True, q, dq)
+        frictionloss, damping = self.model.compute_frictions(
+            torque_actuator, torque_external, dq
+        )
+        # The applied torque is zeroed when the actuator is not powered
+        torque = np.where(torque_enable, torque, 0.0)
+        self.control = np.broadcast_to(control, (n,))
+
+        frictionloss = np.broadcast_to(frictionloss, (n,))
+        damping = np.broadcast_to(damping, (n,))
+        for i, (mujoco_model, mujoco_data, controller) in enumerate(self.instances):
+            mujoco_data.ctrl[controller.act_indexes[0]] = torque[i]
+            mujoco_model.dof_frictionloss[controller.dof_indexes[0]] = frictionloss[i]
+            mujoco_model.dof_damping[controller.dof_indexes[0]] = damping[i]
+
+    @staticmethod
+    def _step_chunk(chunk: list):
+        for mujoco_model, mujoco_data, _ in chunk:
+            mujoco.mj_step(mujoco_model, mujoco_data)
+
     def step(self, goal_position, torque_enable, dt: float):
         """Advance every environment by one timestep.
 
         Unlike :meth:`bam.simulate.Simulator.step` (which is fed a raw control
         signal), the actuator here is a position controller: the input is the
-        goal position and the :class:`MujocoController` computes the control and
-        the applied torque internally.
+        goal position and the control and the applied torque are computed
+        internally (see :meth:`update`).
 
         :param goal_position: Target joint angle(s) [rad], scalar or per-environment.
         :param torque_enable: Whether the actuator is powered (scalar or per-env).
@@ -283,71 +635,109 @@ class Simulator:
             friction act.
         :param dt: Timestep [s].
         """
-        goal_position = np.broadcast_to(
-            np.atleast_1d(np.asarray(goal_position, dtype=float)),
-            (len(self.instances),),
-        )
-        torque_enable = np.broadcast_to(
-            np.atleast_1d(np.asarray(torque_enable)), (len(self.instances),)
-        )
+        self.update(goal_position, torque_enable, dt)
 
-        for i, (mujoco_model, mujoco_data, controller) in enumerate(self.instances):
+        for mujoco_model, _, _ in self.instances:
             mujoco_model.opt.timestep = dt
-            controller.set_q_target(self.actuator, goal_position[i])
-            controller.update()
-            if not torque_enable[i]:
-                mujoco_data.ctrl[controller.act_indexes] = 0.0
-            mujoco.mj_step(mujoco_model, mujoco_data)
+        if len(self.chunks) > 1:
+            if self.executor is None:
+                # Imported lazily, only the threaded stepping needs it
+                from concurrent.futures import ThreadPoolExecutor
+
+                self.executor = ThreadPoolExecutor(self.threads)
+            # Each thread steps its environments
+            list(self.executor.map(self._step_chunk, self.chunks))
+        else:
+            self._step_chunk(self.instances)
 
         self.t += dt
 
-    def rollout_log(self, log: dict, reset_period: float = None):
+    def rollout_log(
+        self, log: dict, reset_period: float | None = None, outputs: tuple = OUTPUTS
+    ) -> tuple:
         """Roll out the model against a recorded log and return predicted trajectories.
 
         Mirrors :meth:`bam.simulate.Simulator.rollout_log`, but drives the
-        actuator through the :class:`MujocoController` (position control from the
+        actuator as the :class:`MujocoController` (position control from the
         recorded ``goal_position``), so it is equivalent to the reference
         simulator's ``simulate_control=True`` mode.
 
         :param log: Processed log dict (see :meth:`bam.logs.Logs.make_batch`).
         :param reset_period: If set, re-synchronize the state to the log at this
             interval [s].
-        :returns: Tuple ``(positions, velocities, controls)`` — lists of values
-            at each timestep. ``controls`` are the voltages/currents computed by
-            the controller.
+        :param outputs: Outputs to return, among ``"positions"``, ``"velocities"``
+            and ``"controls"``.
+        :returns: Tuple of the requested outputs (by default ``(positions,
+            velocities, controls)``), arrays whose first axis is the timestep.
+            ``controls`` are the voltages/currents computed by the controller.
         """
-        positions = []
-        velocities = []
-        controls = []
-
-        dt = log["dt"]
-        self.model.actuator.load_log(log)
-
-        first_entry = log["entries"][0]
-        self.reset(
-            first_entry["position"],
-            first_entry["speed"] if "speed" in first_entry else 0.0,
-        )
+        results = self.rollout_logs([log], reset_period, outputs)
+        return tuple(values[0] for values in results)
 
+    def rollout_logs(
+        self,
+        logs: list[dict],
+        reset_period: float | None = None,
+        outputs: tuple = OUTPUTS,
+    ) -> tuple:
+        """Roll out the model against a batch of logs, one environment per log.
+
+        The logs must share the same timestep ``dt``, but may differ in testbench,
+        firmware gains, initial state and length (the shorter logs are padded by
+        holding their last entry, and their outputs trimmed back to their length).
+        Combined with ``threads``, a whole log directory is rolled out on all the
+        cores.
+
+        :param logs: List of processed log dicts.
+        :param reset_period: If set, re-synchronize the states to the logs at this
+            interval [s].
+        :param outputs: Outputs to return, among ``"positions"``, ``"velocities"``
+            and ``"controls"``.
+        :returns: Tuple of the requested outputs (by default ``(positions,
+            velocities, controls)``), each a list (one entry per log) of
+            per-timestep arrays.
+        """
+        dts = {log["dt"] for log in logs}
+        if len(dts) != 1:
+            raise ValueError(f"All logs must share the same dt, got {sorted(dts)}")
+        dt = dts.pop()
+        dataset = Dataset(logs)
+        self.model.actuator.load_log(dataset)
+
+        speed = dataset.speed
+        if speed is None:
+            speed = np.zeros_like(dataset.position)
+        self.reset(dataset.position[:, 0], speed[:, 0])
+
+        # Preallocated (steps x environments) outputs
+        arrays = {output: np.empty((dataset.n_steps, len(logs))) for output in outputs}
         reset_period_t = 0.0
-        for entry in log["entries"]:
+        for k in range(dataset.n_steps):
             reset_period_t += dt
             if reset_period is not None and reset_period_t > reset_period:
                 reset_period_t = 0.0
-                self.reset(entry["position"], entry["speed"])
-
-            positions.append(copy(self.q))
-            velocities.append(copy(self.dq))
-
-            # Control recomputed the same way the controller does, for reference.
-            control = self.model.actuator.compute_control(
-                entry["goal_position"], self.q, self.dq, dt
-            )
-            controls.append(copy(control))
-
-            self.step(entry["goal_position"], entry["torque_enable"], dt)
-
-        return positions, velocities, controls
+                self.reset(dataset.position[:, k], speed[:, k])
+
+            for (_, mujoco_data, controller), envs in zip(self.instances, self.envs):
+                if "positions" in arrays:
+                    arrays["positions"][k, envs] = mujoco_data.qpos[
+                        controller.qpos_indexes
+                    ]
+                if "velocities" in arrays:
+                    arrays["velocities"][k, envs] = mujoco_data.qvel[
+                        controller.dof_indexes
+                    ]
+
+            self.step(dataset.goal_position[:, k], dataset.torque_enable[:, k], dt)
+
+            if "controls" in arrays:
+                # Control computed during the step
+                arrays["controls"][k] = self.control
+
+        return tuple(
+            [arrays[output][:length, i] for i, length in enumerate(dataset.lengths)]
+            for output in outputs
+        )
 
 
 def load_config(
@@ -356,6 +746,7 @@ def load_config(
     mujoco_data: mujoco.MjData,
     kp: float,
     vin: float,
+    fused: bool = False,
 ) -> tuple:
     """
     Loads a BAM configuration file and returns the list of controllers and the mapping dicts.
@@ -366,11 +757,14 @@ def load_config(
         mujoco_data (mujoco.MjData): the mujoco data
         kp (float): the proportional gain
         vin (float): the input voltage
+        fused (bool): if True, all the dofs are controlled by a single
+            FusedMujocoController, updated in one pass per step
 
     Returns:
-        list: list of controllers, dofs to model mapping, dofs to id mapping
+        list: dict of controllers (or the FusedMujocoController if fused), dofs to
+        model mapping
     """
-    bam_controllers = {}
+    models = {}
     dof_to_bam_controller = {}
     with open(path) as f:
         data = json.load(f)
@@ -384,10 +778,18 @@ def load_config(
             model.actuator.vin = vin
             model.actuator.error_gain = value["error_gain"]
             model.actuator.max_pwm = value["max_pwm"]
+            models[key] = (model, dofs)
 
-            bam_controllers[key] = MujocoController(
-                model, dofs, mujoco_model, mujoco_data
-            )
-            bam_controllers[key].dofs = dofs
+    if fused:
+        controller = FusedMujocoController(
+            list(models.values()), mujoco_model, mujoco_data
+        )
+        controller.dofs = list(dof_to_bam_controller)
+        return controller, dof_to_bam_controller
+
+    bam_controllers = {}
+    for key, (model, dofs) in models.items():
+        bam_controllers[key] = MujocoController(model, dofs, mujoco_model, mujoco_data)
+        bam_controllers[key].dofs = dofs
 
     return bam_controllers, dof_to_bam_controller
@@ -0,0 +1,614 @@
+# Copyright 2025 Marc Duclusaud & Grégoire Passault
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+"""Compiled (Numba) mirror of :class:`bam.simulate.Simulator`.
+
+The reference simulator dispatches every step through the testbench, the
+actuator and the model, which is flexible but dominated by Python overhead. This
+module flattens the pendulum testbench, all the built-in actuators and the m1–m6
+friction models into a single jit-compiled rollout loop. The model parameters
+are gathered in a ``(P, K)`` matrix once per rollout, so parameter-batched
+models (see :meth:`bam.model.Model.set_parameters_batch`) are supported too.
+
+Trajectories match the reference simulator within floating point tolerance; use
+``python -m bam.benchmark rollout`` to check the parity and measure the speedup.
+"""
+
+import numpy as np
+import numba
+
+from .model import Model
+from . import simulate
+from .simulate import OUTPUTS
+from .logs import Dataset, columns, valid_steps
+from .testbench import Pendulum
+from .actuator import VoltageControlledActuator, CurrentControlledActuator
+from .dynamixel.actuator import (
+    MXActuator,
+    XL320Actuator,
+    XL330Actuator,
+    XL330CurrentActuator,
+)
+from .erob.actuator import ErobActuator
+from .feetech.actuator import STS3215Actuator
+from .unitree.actuator import UnitreeGo1Actuator
+
+# Actuator kinds, each one is a (control law, torque equation) pair of the kernel
+VOLTAGE = 0
+CURRENT = 1
+XL330_CURRENT = 2
+STS3215 = 3
+EROB = 4
+UNITREE = 5
+
+# Only the exact classes are supported, a subclass may override the control law
+actuator_kinds = {
+    VoltageControlledActuator: VOLTAGE,
+    MXActuator: VOLTAGE,
+    XL320Actuator: VOLTAGE,
+    XL330Actuator: VOLTAGE,
+    CurrentControlledActuator: CURRENT,
+    XL330CurrentActuator: XL330_CURRENT,
+    STS3215Actuator: STS3215,
+    ErobActuator: EROB,
+    UnitreeGo1Actuator: UNITREE,
+}
+
+# Columns of the parameters matrix, parameters missing from a model are left to 0
+parameter_names = [
+    "q_offset",
+    "kt",
+    "R",
+    "armature",
+    "current_limit",
+    "error_gain_ratio",
+    "max_velocity",
+    "ratio",
+    "max_torque",
+    "friction_base",
+    "friction_stribeck",
+    "load_friction_base",
+    "load_friction_stribeck",
+    "load_friction_motor",
+    "load_friction_external",
+    "load_friction_motor_stribeck",
+    "load_friction_external_stribeck",
+    "load_friction_motor_quad",
+    "load_friction_external_quad",
+    "dtheta_stribeck",
+    "alpha",
+    "friction_viscous",
+]
+(
+    Q_OFFSET,
+    KT,
+    R,
+    ARMATURE,
+    CURRENT_LIMIT,
+    ERROR_GAIN_RATIO,
+    MAX_VELOCITY,
+    RATIO,
+    MAX_TORQUE,
+    FRICTION_BASE,
+    FRICTION_STRIBECK,
+    LOAD_FRICTION_BASE,
+    LOAD_FRICTION_STRIBECK,
+    LOAD_FRICTION_MOTOR,
+    LOAD_FRICTION_EXTERNAL,
+    LOAD_FRICTION_MOTOR_STRIBECK,
+    LOAD_FRICTION_EXTERNAL_STRIBECK,
+    LOAD_FRICTION_MOTOR_QUAD,
+    LOAD_FRICTION_EXTERNAL_QUAD,
+    DTHETA_STRIBECK,
+    ALPHA,
+    FRICTION_VISCOUS,
+) = range(len(parameter_names))
+
+# Columns of the per-log settings matrix
+MASS, ARM_MASS, LENGTH, KP, VIN, DAMPING, DT = range(7)
+
+# Entries of the actuator constants vector
+ERROR_GAIN, MAX_PWM, MAX_CURRENT, MAX_AMPS, MAX_VOLTS = range(5)
+
+
+@numba.njit(cache=True)
+def _clamp(x, low, high):
+    # Same semantics as np.clip / torch.clamp when low > high
+    return min(max(x, low), high)
+
+
+@numba.njit(cache=True)
+def _frictions(flags, p, motor_torque, external_torque, dtheta):
+    """Mirror of :meth:`bam.model.Model.compute_frictions`"""
+    load_dependent = flags[0]
+    directional = flags[1]
+    stribeck = flags[2]
+    quadratic = flags[3]
+
+    gearbox_torque = 0.0
+    gearbox_torque_stribeck = 0.0
+    if directional:
+        gearbox_torque = abs(
+            external_torque * p[LOAD_FRICTION_EXTERNAL]
+            - motor_torque * p[LOAD_FRICTION_MOTOR]
+        )
+        if stribeck:
+            gearbox_torque_stribeck = abs(
+                external_torque * p[LOAD_FRICTION_EXTERNAL_STRIBECK]
+                - motor_torque * p[LOAD_FRICTION_MOTOR_STRIBECK]
+            )
+    else:
+        gearbox_torque = abs(external_torque - motor_torque)
+
+    stribeck_coeff = 0.0
+    if stribeck:
+        stribeck_coeff = np.exp(-(abs(dtheta / p[DTHETA_STRIBECK]) ** p[ALPHA]))
+
+    frictionloss = p[FRICTION_BASE]
+    if load_dependent:
+        if directional:
+            frictionloss += gearbox_torque
+        else:
+            frictionloss += p[LOAD_FRICTION_BASE] * gearbox_torque
+
+    if stribeck:
+        frictionloss += stribeck_coeff * p[FRICTION_STRIBECK]
+
+        if load_dependent:
+            if directional:
+                frictionloss += gearbox_torque_stribeck * stribeck_coeff
+            else:
+                frictionloss += (
+                    p[LOAD_FRICTION_STRIBECK] * gearbox_torque * stribeck_coeff
+                )
+
+            if quadratic:
+                enable_quadratic = np.sign(external_torque) != np.sign(motor_torque)
+                direction_motor = abs(external_torque) < abs(motor_torque)
+                direction_external = abs(external_torque) > abs(motor_torque)
+
+                gearbox_torque2_motor = (
+                    p[LOAD_FRICTION_EXTERNAL_QUAD] * abs(external_torque) ** 2
+                )
+                gearbox_torque2_external = (
+                    p[LOAD_FRICTION_MOTOR_QUAD] * abs(motor_torque) ** 2
+                )
+
+                frictionloss += (
+                    stribeck_coeff
+                    * (
+                        direction_motor * gearbox_torque2_motor
+                        + direction_external * gearbox_torque2_external
+                    )
+                    * enable_quadratic
+                )
+
+    return frictionloss, p[FRICTION_VISCOUS]
+
+
+@numba.njit(cache=True)
+def _control(kind, constants, p, s, q_target_smooth, q_target, q, dq, dt):
+    """Mirror of the actuators ``compute_control``, returns the control and the
+    updated STS3215 smoothed target"""
+    error_gain = constants[ERROR_GAIN]
+    max_pwm = constants[MAX_PWM]
+    max_current = constants[MAX_CURRENT]
+    max_amps = constants[MAX_AMPS]
+    kp = s[KP]
+    vin = s[VIN]
+
+    if kind == VOLTAGE:
+        duty_cycle = (q_target - q) * kp * error_gain
+        if not np.isnan(max_current):
+            duty_span = p[R] * max_current / vin
+            duty_center = p[KT] * dq / vin
+            duty_cycle = _clamp(
+                duty_cycle, duty_center - duty_span, duty_center + duty_span
+            )
+        duty_cycle = _clamp(duty_cycle, -max_pwm, max_pwm)
+        return vin * duty_cycle, q_target_smooth
+    elif kind == CURRENT or kind == XL330_CURRENT:
+        current = (q_target - q) * kp * error_gain
+        current_limit_low = (1 / p[R]) * (vin - p[KT] * dq)
+        current_limit_high = (1 / p[R]) * (-vin - p[KT] * dq)
+        current = _clamp(current, current_limit_high, current_limit_low)
+        current = _clamp(current, -p[CURRENT_LIMIT], p[CURRENT_LIMIT])
+        return current, q_target_smooth
+    elif kind == STS3215:
+        q_target_smooth = _clamp(
+            q_target,
+            q_target_smooth - p[MAX_VELOCITY] * dt,
+            q_target_smooth + p[MAX_VELOCITY] * dt,
+        )
+        duty_cycle = (q_target_smooth - q) * kp * error_gain * p[ERROR_GAIN_RATIO]
+        duty_cycle = _clamp(duty_cycle, -max_pwm, max_pwm)
+        return vin * duty_cycle, q_target_smooth
+    elif kind == EROB:
+        amps = (q_target - q) * kp + s[DAMPING] * np.sqrt(kp) * (0.0 - dq)
+        return _clamp(amps, -max_amps, max_amps), q_target_smooth
+    else:
+        torque = (q_target - q) * kp * p[RATIO] + s[DAMPING] * (0.0 - dq)
+        return _clamp(torque, -p[MAX_TORQUE], p[MAX_TORQUE]), q_target_smooth
+
+
+@numba.njit(cache=True)
+def _torque(kind, constants, p, s, control, torque_enable, dq):
+    """Mirror of the actuators ``compute_torque``"""
+    max_volts = constants[MAX_VOLTS]
+    vin = s[VIN]
+
+    if kind == VOLTAGE or kind == STS3215:
+        torque = p[KT] * control / p[R]
+        torque -= (p[KT] ** 2) * dq / p[R]
+        return torque * torque_enable
+    elif kind == CURRENT:
+        return p[KT] * control * torque_enable
+    elif kind == XL330_CURRENT:
+        sign = np.sign(control)
+        disc = (p[KT] * dq) ** 2 + 4.0 * vin * p[R] * abs(control)
+        duty = (p[KT] * dq + sign * disc**0.5) / (2.0 * vin)
+        duty = _clamp(duty, -1.0, 1.0)
+        phase_current = (duty * vin - p[KT] * dq) / p[R]
+        return p[KT] * phase_current * torque_enable
+    elif kind == EROB:
+        torque = p[KT] * (control * torque_enable)
+        volts_bounded_torque = (p[KT] / p[R]) * max_volts
+        emf = (p[KT] ** 2) * dq / p[R]
+        return _clamp(torque, -volts_bounded_torque - emf, volts_bounded_torque - emf)
+    else:
+        return control * torque_enable
+
+
+# Releases the GIL, so that rollouts of other threads (e.g. the validation of bam.fit
+# reports) run concurrently
+@numba.njit(cache=True, nogil=True)
+def _rollout(
+    kind,
+    flags,
+    constants,
+    parameters,
+    settings,
+    goal_position,
+    torque_enable,
+    position,
+    speed,
+    control,
+    use_log_control,
+    simulate_control,
+    reset_period,
+    reset_dt,
+    lengths,
+    max_errors,
+    store,
+    out_positions,
+    out_velocities,
+    out_controls,
+    out_errors,
+    out_counts,
+):
+    """Rolls out P parameter sets over N logs of T steps, mirroring
+    :meth:`bam.simulate.Simulator.rollout_log` and :meth:`bam.simulate.Simulator.step`.
+    A negative ``reset_period`` disables the resets. The absolute position errors
+    are accumulated per parameter set (over ``out_counts`` steps, padding steps
+    beyond ``lengths`` excluded), whose rollout is aborted once its error exceeds
+    ``max_errors``. Only the outputs flagged in ``store`` (positions, velocities,
+    controls) are written, the others can be empty arrays."""
+    g = -9.80665
+    n_parameters = parameters.shape[0]
+    n_logs, n_steps = position.shape
+
+    for i in range(n_parameters):
+        p = parameters[i]
+        out_errors[i] = 0.0
+        out_counts[i] = 0
+        for j in range(n_logs):
+            if out_errors[i] > max_errors[i]:
+                break
+            s = settings[j]
+            dt = s[DT]
+            inertia = s[MASS] * s[LENGTH] ** 2
+            inertia += (s[ARM_MASS] / 3) * s[LENGTH] ** 2
+            inertia += p[ARMATURE]
+
+            q = position[j, 0]
+            dq = speed[j, 0]
+            q_target_smooth = 0.0
+            reset_period_t = 0.0
+
+            for k in range(n_steps):
+                reset_period_t += reset_dt
+                if reset_period >= 0.0 and reset_period_t > reset_period:
+                    reset_period_t = 0.0
+                    q = position[j, k]
+                    dq = speed[j, k]
+                if store[0]:
+                    out_positions[i, j, k] = q
+                if store[1]:
+                    out_velocities[i, j, k] = dq
+
+                if k < lengths[j]:
+                    out_errors[i] += abs(q - position[j, k])
+                    out_counts[i] += 1
+                if out_errors[i] > max_errors[i]:
+                    break
+
+                if simulate_control:
+                    u, q_target_smooth = _control(
+                        kind,
+                        constants,
+                        p,
+                        s,
+                        q_target_smooth,
+                        goal_position[j, k],
+                        q,
+                        dq,
+                        dt,
+                    )
+                elif use_log_control:
+                    u = control[j, k]
+                else:
+                    u, q_target_smooth = _control(
+                        kind,
+                        constants,
+                        p,
+                        s,
+                        q_target_smooth,
+                        goal_position[j, k],
+                        position[j, k],
+                        dq,
+                        dt,
+                    )
+                if store[2]:
+                    out_controls[i, j, k] = u
+
+                # Simulator.step()
+                q_joint = q + p[Q_OFFSET]
+                bias_torque = (
+                    (s[MASS] + s[ARM_MASS] / 2) * g * s[LENGTH] * np.sin(q_joint)
+                )
+                motor_torque = _torque(
+                    kind, constants, p, s, u, torque_enable[j, k], dq
+                )
+                frictionloss, damping = _frictions(
+                    flags, p, motor_torque, bias_torque, dq
+                )
+                net_torque = motor_torque + bias_torque
+
+                tau_stop = (inertia / dt) * dq + net_torque
+                static_friction = -np.sign(tau_stop) * min(
+                    abs(tau_stop), frictionloss + damping * abs(dq)
+                )
+                net_torque = net_torque + static_friction
+
+                angular_acceleration = net_torque / inertia
+
+                dq = _clamp(dq + angular_acceleration * dt, -100.0, 100.0)
+                q = q + (dq * dt + 0.5 * angular_acceleration * dt**2)
+
+
+class Simulator:
+    """Compiled counterpart of :class:`bam.simulate.Simulator`.
+
+    Supports the pendulum testbench, the built-in actuators (voltage, current,
+    eRob, Unitree and STS3215) and the m1–m6 models, batched or not over the
+    parameters (see :meth:`bam.model.Model.set_parameters_batch`).
+
+    :param model: BAM friction model to simulate.
+    """
+
+    def __init__(self, model: Model):
+        self.model = model
+
+        actuator = model.actuator
+        if type(actuator) not in actuator_kinds:
+            raise NotImplementedError(
+                f"No compiled rollout for actuator {type(actuator).__name__}"
+            )
+        self.kind = actuator_kinds[type(actuator)]
+        self.flags = np.array(
+            [model.load_dependent, model.directional, model.stribeck, model.quadratic]
+        )
+        max_current = getattr(actuator, "max_current", None)
+        self.constants = np.array(
+            [
+                getattr(actuator, "error_gain", 0.0),
+                getattr(actuator, "max_pwm", 0.0),
+                np.nan if max_current is None else max_current,
+                getattr(actuator, "max_amps", 0.0),
+                getattr(actuator, "max_volts", 0.0),
+            ],
+            dtype=float,
+        )
+
+    def _parameters(self) -> np.ndarray:
+        """
+        Gather the model parameters in a (P x K) matrix
+        """
+        parameters = self.model.get_parameters()
+        batch_size = self.model.parameters_batch_size or 1
+        matrix = np.zeros((batch_size, len(parameter_names)))
+        for k, name in enumerate(parameter_names):
+            if name in parameters:
+                matrix[:, k] = np.ravel(parameters[name].value)
+        return matrix
+
+    def _settings(self, log: dict, n_logs: int) -> np.ndarray:
+        """
+        Gather the per-log testbench and actuator settings in a (N x 7) matrix
+        """
+        actuator = self.model.actuator
+        actuator.load_log(log)
+        testbench = actuator.testbench
+        if not isinstance(testbench, Pendulum):
+            raise NotImplementedError(
+                f"No compiled rollout for testbench {type(testbench).__name__}"
+            )
+
+        settings = np.zeros((n_logs, 7))
+        settings[:, MASS] = testbench.mass
+        settings[:, ARM_MASS] = testbench.arm_mass
+        settings[:, LENGTH] = testbench.length
+        settings[:, KP] = getattr(actuator, "kp", 0.0)
+        settings[:, VIN] = getattr(actuator, "vin", 0.0)
+        settings[:, DAMPING] = getattr(actuator, "damping", 0.0)
+        settings[:, DT] = log["dt"]
+        return settings
+
+    def _rollout(
+        self,
+        log: dict,
+        reset_period: float | None,
+        simulate_control: bool,
+        max_error: float = np.inf,
+        outputs: tuple = OUTPUTS,
+    ) -> tuple:
+        """
+        Runs the kernel, returns the requested outputs (among positions, velocities
+        and controls) arrays of shape (P x N x T), the (P) accumulated absolute
+        position errors and the (P) number of simulated steps
+        """
+        if isinstance(log, Dataset):
+            n_logs, n_steps = len(log), log.n_steps
+            lengths = log.lengths
+            arrays = {
+                channel: getattr(log, channel)
+                for channel in Dataset.channels
+                if getattr(log, channel) is not None
+            }
+        else:
+            n_steps = len(log["entries"])
+            n_logs = np.size(log["entries"][0]["position"])
+            lengths = np.sum(valid_steps(log), axis=0)
+            arrays = {
+                key: np.array(values, dtype=float).reshape(n_steps, n_logs).T
+                for key, values in columns(log).items()
+                if key in Dataset.channels
+            }
+
+        def column(key: str) -> np.ndarray:
+            if key not in arrays:
+                return np.zeros((n_logs, n_steps))
+            return np.ascontiguousarray(arrays[key], dtype=float)
+
+        use_log_control = "control" in arrays and not simulate_control
+        parameters = self._parameters()
+        settings = self._settings(log, n_logs)
+        # The outputs that are not requested are neither allocated nor written
+        store = np.array([output in outputs for output in OUTPUTS])
+        results = {
+            output: np.empty((len(parameters), n_logs, n_steps) if stored else (0,) * 3)
+            for output, stored in zip(OUTPUTS, store)
+        }
+        errors = np.empty(len(parameters))
+        counts = np.empty(len(parameters), dtype=np.int64)
+
+        _rollout(
+            self.kind,
+            self.flags,
+            self.constants,
+            parameters,
+            settings,
+            column("goal_position"),
+            column("torque_enable"),
+            column("position"),
+            column("speed"),
+            column("control"),
+            use_log_control,
+            simulate_control,
+            -1.0 if reset_period is None else reset_period,
+            np.max(settings[:, DT]),
+            np.asarray(lengths, dtype=np.int64),
+            np.ascontiguousarray(
+                np.broadcast_to(max_error, len(parameters)), dtype=float
+            ),
+            store,
+            *results.values(),
+            errors,
+            counts,
+        )
+        return tuple(results[output] for output in outputs), errors, counts
+
+    def rollout_log(
+        self,
+        log: dict,
+        reset_period: float | None = None,
+        simulate_control: bool = False,
+        outputs: tuple = OUTPUTS,
+    ) -> tuple:
+        """Roll out the model against a recorded log and return predicted trajectories.
+
+        Same as :meth:`bam.simulate.Simulator.rollout_log`.
+
+        :returns: Tuple of the requested outputs, arrays whose first axis is the
+            timestep.
+        """
+        arrays, _, _ = self._rollout(
+            log, reset_period, simulate_control, outputs=outputs
+        )
+
+        # Drop the axes the reference simulator doesn't have
+        if self.model.parameters_batch_size is None:
+            arrays = [array[0] for array in arrays]
+            single_log = not isinstance(log, Dataset) and np.ndim(log["dt"]) == 0
+            if single_log:
+                arrays = [array[0] for array in arrays]
+
+        return tuple(np.moveaxis(array, -1, 0) for array in arrays)
+
+    def rollout_batch(
+        self,
+        log: dict,
+        reset_period: float | None = None,
+        simulate_control: bool = False,
+    ) -> tuple:
+        """Roll out a parameters batch against a log batch.
+
+        Same as :meth:`bam.simulate.Simulator.rollout_batch`.
+
+        :returns: Tuple ``(positions, velocities, controls)`` of arrays of shape
+            ``(P, N, T)``.
+        """
+        if self.model.parameters_batch_size is None:
+            raise ValueError(
+                "The model is not batched, call model.set_parameters_batch() first"
+            )
+        return self._rollout(log, reset_period, simulate_control)[0]
+
+    # Rolls out the segments as a dataset with rollout_log, as the reference one
+    rollout_segments = simulate.Simulator.rollout_segments
+
+    def rollout_mae(
+        self,
+        log: dict,
+        reset_period: float | None = None,
+        simulate_control: bool = False,
+        max_mae: float | None = None,
+    ) -> tuple:
+        """Roll out the model against a recorded log and return its mean absolute
+        position error.
+
+        Same as :meth:`bam.simulate.Simulator.rollout_mae`, except that each
+        parameter set of a batch is aborted on its own.
+
+        :param max_mae: See :meth:`bam.simulate.Simulator.rollout_mae`, can be a
+            vector of one bound per parameter set.
+        :returns: Tuple ``(mae, complete)``.
+        """
+        n_values = np.count_nonzero(valid_steps(log))
+        max_error = np.inf if max_mae is None else max_mae * n_values
+        # Only the errors are accumulated, the trajectories are not stored
+        _, errors, counts = self._rollout(
+            log, reset_period, simulate_control, max_error, outputs=()
+        )
+
+        # The kernel counts the simulated (valid) steps, a rollout is complete
+        # unless it was aborted before the end of the logs
+        mae, complete = errors / counts, counts == n_values
+        if self.model.parameters_batch_size is None:
+            return float(mae[0]), bool(complete[0])
+        return mae, complete
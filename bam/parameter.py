@@ -8,12 +8,16 @@
 
 
 class Parameter:
-    """A scalar model parameter with bounds and an optimization flag.
+    """A model parameter with bounds and an optimization flag.
 
     Parameters are attached to a :class:`~bam.model.Model` by
     :meth:`~bam.model.Model.set_actuator` and collected by
     :meth:`~bam.model.Model.get_parameters` for optimization.
 
+    The value is a scalar, except when the model is batched over several
+    parameter sets (see :meth:`~bam.model.Model.set_parameters_batch`), in which
+    case it is a column vector with one row per parameter set.
+
     :param value: Initial value.
     :param min: Lower bound used by the optimizer.
     :param max: Upper bound used by the optimizer.
@@ -14,84 +14,149 @@ from .model import load_model, DummyModel
 from .actuators import actuators
 from . import simulate
 from . import logs
+from .cache import RolloutCache, rollout_options
 
-arg_parser = argparse.ArgumentParser()
-arg_parser.add_argument("--logdir", type=str, required=True)
-arg_parser.add_argument("--params", type=str, default=["params.json"], nargs="+")
-arg_parser.add_argument("--actuator", type=str, required=True)
-arg_parser.add_argument("--reset_period", default=None, type=float)
-arg_parser.add_argument("--sim", action="store_true")
-arg_parser.add_argument(
-    "--sim-mujoco",
-    dest="sim_mujoco",
-    action="store_true",
-    help="Same as --sim but rolls out with the MuJoCo (CPU) simulator backend",
-)
-arg_parser.add_argument(
-    "--sim-mjlab",
-    dest="sim_mjlab",
-    action="store_true",
-    help="Same as --sim but rolls out with the mjlab (MuJoCo Warp / GPU) simulator backend",
-)
-args = arg_parser.parse_args()
-
-# Whether to overlay a simulation, and which backend to use.
-do_sim = args.sim or args.sim_mujoco or args.sim_mjlab
-if args.sim_mujoco:
-    sim_name = "MuJoCo"
-elif args.sim_mjlab:
-    sim_name = "mjlab"
-else:
-    sim_name = "reference"
-
-logs = logs.Logs(args.logdir)
-
-if args.sim_mujoco:
+# Names of the simulator backends, shown on the plots
+sim_names = {"reference": "reference", "mujoco": "MuJoCo", "mjlab": "mjlab"}
+
+
+def rollout(
+    params_file: str,
+    log: dict,
+    log_dataset: logs.Dataset,
+    backend: str = "reference",
+    reset_period: float | None = None,
+    cache: RolloutCache | None = None,
+) -> tuple:
+    """
+    Rolls out a params file against a log, with a simulator backend (reference,
+    mujoco or mjlab), or gets the rollout from the cache. log_dataset is the log as
+    a single-log dataset.
+    Returns the model name and the simulated positions, speeds and controls arrays
+    """
+    model = load_model(params_file)
+    if cache is not None:
+        sim_q, sim_speed, sim_controls = cache.rollout(
+            params_file,
+            log,
+            backend,
+            lambda: rollout(params_file, log, log_dataset, backend, reset_period)[1:],
+            **rollout_options(backend, reset_period),
+        )
+    elif backend == "mujoco":
+        # Imported lazily so --sim (or no sim) doesn't require MuJoCo.
+        from . import mujoco as mujoco_backend
+
+        simulator = mujoco_backend.Simulator(model)
+        sim_q, sim_speed, sim_controls = simulator.rollout_log(
+            log, reset_period=reset_period
+        )
+    elif backend == "mjlab":
+        # Imported lazily so other backends don't require mjlab.
+        from . import mjlab as mjlab_backend
+
+        simulator = mjlab_backend.Simulator(json_path=params_file)
+        sim_q, sim_speed, sim_controls = simulator.rollout_log(
+            log, reset_period=reset_period
+        )
+    else:
+        simulator = simulate.Simulator(model)
+        sim_q, sim_speed, sim_controls = (
+            np.array(values)[:, 0]
+            for values in simulator.rollout_log(
+                log_dataset,
+                reset_period=reset_period,
+                simulate_control=True,
+            )
+        )
+    return model.name, np.array(sim_q), np.array(sim_speed), np.array(sim_controls)
+
+
+def rollout_logs_mujoco(
+    params_file: str,
+    all_logs: list,
+    reset_period: float | None = None,
+    cache: RolloutCache | None = None,
+    threads: int | None = None,
+    stacked: bool = False,
+) -> list:
+    """
+    Rolls out a params file against all the logs at once with the MuJoCo simulator
+    backend (one environment per log, stepped on threads, or all in a single
+    stacked scene), except the rollouts found in the cache.
+    Returns the model name and the simulated positions, speeds and controls arrays
+    of each log
+    """
     # Imported lazily so --sim (or no sim) doesn't require MuJoCo.
-    from . import mujoco as mujoco_backend
+    from .mae import rollouts_mujoco
 
-if args.sim_mjlab:
-    # Imported lazily so other backends don't require mjlab.
-    from . import mjlab as mjlab_backend
+    model = load_model(params_file)
+    options = rollout_options("mujoco", reset_period, stacked)
+    results = [None] * len(all_logs)
+    if cache is not None:
+        for index, log in enumerate(all_logs):
+            results[index] = cache.get(cache.key(params_file, log, "mujoco", **options))
 
-if do_sim:
-    model_names = args.params
+    # Logs to simulate, by dt (a batch shares a single timestep)
+    groups: dict[float, list[int]] = {}
+    for index, log in enumerate(all_logs):
+        if results[index] is None:
+            groups.setdefault(log["dt"], []).append(index)
+    for indices in groups.values():
+        batch = [all_logs[index] for index in indices]
+        for index, result in zip(
+            indices, rollouts_mujoco(model, batch, reset_period, threads, stacked)
+        ):
+            if cache is not None:
+                key = cache.key(params_file, all_logs[index], "mujoco", **options)
+                cache.put(key, *result)
+            results[index] = result
+
+    return [(model.name, *map(np.array, result)) for result in results]
+
+
+def plot_log(
+    log: dict,
+    log_dataset: logs.Dataset,
+    actuator: str,
+    model_names: list[str] | None = None,
+    backend: str = "reference",
+    reset_period: float | None = None,
+    cache: RolloutCache | None = None,
+    rollouts: list | None = None,
+):
+    """
+    Plots a log (log_dataset being the log as a single-log dataset), and the
+    rollouts of the params files model_names if any (rollouts can give them
+    already simulated, as returned by rollout())
+    """
+    if model_names is None:
+        model_names = []
+    do_sim = len(model_names) > 0
+    sim_name = sim_names[backend]
 
-for log in logs.logs:
-    print(log["filename"])
     all_sim_q = []
     all_sim_speeds = []
     all_sim_controls = []
     all_names = []
 
-    if do_sim:
-        for model_name in model_names:
-            model = load_model(model_name)
-            all_names.append(model.name)
-            if args.sim_mujoco:
-                simulator = mujoco_backend.Simulator(model)
-                sim_q, sim_speed, sim_controls = simulator.rollout_log(
-                    log, reset_period=args.reset_period
-                )
-            elif args.sim_mjlab:
-                simulator = mjlab_backend.Simulator(json_path=model_name)
-                sim_q, sim_speed, sim_controls = simulator.rollout_log(
-                    log, reset_period=args.reset_period
-                )
-            else:
-                simulator = simulate.Simulator(model)
-                sim_q, sim_speed, sim_controls = simulator.rollout_log(
-                    log, reset_period=args.reset_period, simulate_control=True
-                )
-            all_sim_q.append(np.array(sim_q))
-            all_sim_speeds.append(np.array(sim_speed))
-            all_sim_controls.append(np.array(sim_controls))
-
-    ts = np.arange(len(log["entries"])) * log["dt"]
-    q = [entry["position"] for entry in log["entries"]]
-    goal_q = [entry["goal_position"] for entry in log["entries"]]
-    speed = [entry["speed"] if "speed" in entry else 0.0 for entry in log["entries"]]
-    has_speed = any("speed" in entry for entry in log["entries"])
+    for index, model_name in enumerate(model_names):
+        if rollouts is not None:
+            name, sim_q, sim_speed, sim_controls = rollouts[index]
+        else:
+            name, sim_q, sim_speed, sim_controls = rollout(
+                model_name, log, log_dataset, backend, reset_period, cache
+            )
+        all_names.append(name)
+        all_sim_q.append(sim_q)
+        all_sim_speeds.append(sim_speed)
+        all_sim_controls.append(sim_controls)
+
+    ts = np.arange(log_dataset.n_steps) * log["dt"]
+    q = log_dataset.position[0]
+    goal_q = log_dataset.goal_position[0]
+    has_speed = log_dataset.speed is not None
+    speed = log_dataset.speed[0] if has_speed else np.zeros_like(q)
 
     # MAE of each simulated model against the recorded data. The params file is
     # shown, since several of them can share the same model.
@@ -99,16 +164,17 @@ for log in logs.logs:
         for params_file, name, sim_q, sim_speeds in zip(
             model_names, all_names, all_sim_q, all_sim_speeds
         ):
-            mae = f"q {np.mean(np.abs(sim_q - np.array(q))):.6f} rad"
+            mae = f"q {np.mean(np.abs(sim_q - q)):.6f} rad"
             if has_speed:
-                mae += f", speed {np.mean(np.abs(sim_speeds - np.array(speed))):.6f} rad/s"
+                mae += f", speed {np.mean(np.abs(sim_speeds - speed)):.6f} rad/s"
             print(f"  {params_file} ({name}) MAE: {mae}")
 
     dummy = DummyModel()
-    dummy.set_actuator(actuators[args.actuator]())
+    dummy.set_actuator(actuators[actuator]())
     simulator = simulate.Simulator(dummy)
-    _, __, controls = simulator.rollout_log(log, simulate_control=False)
-    torque_enable = np.array([entry["torque_enable"] for entry in log["entries"]])
+    _, __, controls = simulator.rollout_log(log_dataset, simulate_control=False)
+    controls = np.array(controls)[:, 0]
+    torque_enable = log_dataset.torque_enable[0]
 
     # Using 2 x-shared subplots
     if has_speed:
@@ -122,11 +188,9 @@ for log in logs.logs:
         for model_name, sim_q in zip(all_names, all_sim_q):
             ax1.plot(ts, sim_q, label=f"{model_name}_q")
     ax1.legend()
-    title = f"{log['motor']}, {log['trajectory']}, m={log['mass']}, l={log['length']}, k={log['kp']}"
-
-    ax1.set_title(
-        f"{log['motor']}, {log['trajectory']}, m={log['mass']}, l={log['length']}, k={log['kp']}"
-    )
+    title = f"{log['motor']}, {log['trajectory']}, "
+    title += f"m={log['mass']}, l={log['length']}, k={log['kp']}"
+    ax1.set_title(title)
     ax1.set_ylabel("angle [rad]")
     ax1.grid()
 
@@ -151,8 +215,8 @@ for log in logs.logs:
     # Shading the areas where torque is False
     ax3.fill_between(
         ts,
-        min([0.0 if c is None else c for c in controls]) - 0.02,
-        max([0.0 if c is None else c for c in controls]) + 0.02,
+        np.min(controls) - 0.02,
+        np.max(controls) + 0.02,
         where=[not torque for torque in torque_enable],
         color="red",
         alpha=0.3,
@@ -167,3 +231,92 @@ for log in logs.logs:
 
     plt.grid()
     plt.show()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--logdir", type=str, required=True)
+    arg_parser.add_argument("--params", type=str, default=["params.json"], nargs="+")
+    arg_parser.add_argument("--actuator", type=str, required=True)
+    arg_parser.add_argument("--reset_period", default=None, type=float)
+    arg_parser.add_argument("--sim", action="store_true")
+    arg_parser.add_argument(
+        "--sim-mujoco",
+        dest="sim_mujoco",
+        action="store_true",
+        help="Same as --sim but rolls out with the MuJoCo (CPU) simulator backend",
+    )
+    arg_parser.add_argument(
+        "--sim-mjlab",
+        dest="sim_mjlab",
+        action="store_true",
+        help="Same as --sim but rolls out with the mjlab (MuJoCo Warp / GPU) "
+        "simulator backend",
+    )
+    arg_parser.add_argument(
+        "--threads",
+        type=int,
+        default=None,
+        help="With --sim-mujoco, roll out all the logs at once before plotting them, "
+        "one environment per log, stepped on this number of threads",
+    )
+    arg_parser.add_argument(
+        "--stacked",
+        action="store_true",
+        help="With --sim-mujoco, roll out all the logs at once before plotting them, "
+        "as independent pendulums of a single scene",
+    )
+    arg_parser.add_argument(
+        "--cache",
+        type=str,
+        default=None,
+        help="Directory of the rollouts cache (default: ~/.cache/bam/rollouts)",
+    )
+    arg_parser.add_argument(
+        "--no-cache",
+        dest="no_cache",
+        action="store_true",
+        help="Simulate all the rollouts, without reading nor writing the cache",
+    )
+    args = arg_parser.parse_args()
+
+    # Whether to overlay a simulation, and which backend to use.
+    do_sim = args.sim or args.sim_mujoco or args.sim_mjlab
+    if args.sim_mujoco:
+        backend = "mujoco"
+    elif args.sim_mjlab:
+        backend = "mjlab"
+    else:
+        backend = "reference"
+
+    all_logs = logs.Logs(args.logdir)
+    dataset = all_logs.compile()
+    cache = None if args.no_cache else RolloutCache(args.cache)
+
+    rollouts = None
+    if do_sim and backend == "mujoco" and (args.threads or args.stacked):
+        rollouts = [
+            rollout_logs_mujoco(
+                params_file,
+                all_logs.logs,
+                args.reset_period,
+                cache,
+                args.threads,
+                args.stacked,
+            )
+            for params_file in args.params
+        ]
+
+    for index, log in enumerate(all_logs.logs):
+        print(log["filename"])
+        # Single-log dataset, whose rollouts are (T x 1)
+        plot_log(
+            log,
+            dataset.select([index]),
+            args.actuator,
+            args.params if do_sim else [],
+            backend,
+            args.reset_period,
+            cache,
+            None if rollouts is None else [results[index] for results in rollouts],
+        )
@@ -10,47 +10,194 @@ import glob
 from copy import deepcopy
 import os
 import json
+import hashlib
 import numpy as np
 import argparse
+import multiprocessing
+from functools import partial
+from .logs import save_log
 
-arg_parser = argparse.ArgumentParser()
-arg_parser.add_argument("--raw", type=str, required=True)
-arg_parser.add_argument("--logdir", type=str, required=True)
-arg_parser.add_argument("--dt", type=float, default=0.005)
-args = arg_parser.parse_args()
+# Name of the file, in the processed logs directory, recording which raw files
+# were processed (and with which settings), for --incremental
+MANIFEST = ".process.json"
 
-for logfile in glob.glob(f"{args.raw}/*.json"):
-    data = json.load(open(logfile))
-    data_output = deepcopy(data)
-    data_output["entries"] = []
-    data_output["dt"] = args.dt
 
+def resample(data: dict, dt: float) -> dict:
+    """
+    Resamples a raw log at a fixed timestep, by linear interpolation of all entry
+    values between the two surrounding raw entries.
+
+    :param data: Raw log dict (entries have a ``timestamp``).
+    :param dt: Target timestep [s].
+    :returns: The processed log dict.
+    """
+    data_output = deepcopy(
+        {key: value for key, value in data.items() if key != "entries"}
+    )
+    data_output["dt"] = dt
+
+    entries = data["entries"]
+    timestamps = np.array([entry["timestamp"] for entry in entries])
+    ts = np.arange(0.0, timestamps[-1], dt)
+
+    # Raw frames surrounding each t: timestamps[frame] < t <= timestamps[frame + 1]
+    frame = np.maximum(np.searchsorted(timestamps, ts, side="left") - 1, 0)
+    t_1 = timestamps[frame]
+    t_2 = timestamps[frame + 1]
+
+    columns = {}
+    for key in entries[0]:
+        if key == "timestamp":
+            continue
+        values = np.array([entry[key] for entry in entries], dtype=float)
+        value_1 = values[frame]
+        value_2 = values[frame + 1]
+        columns[key] = value_1 + (value_2 - value_1) * (ts - t_1) / (t_2 - t_1)
+
+    columns["torque_enable"] = columns["torque_enable"] > 0.5
+    columns["timestamp"] = ts
+
+    columns = {key: values.tolist() for key, values in columns.items()}
+    data_output["entries"] = [
+        dict(zip(columns, values)) for values in zip(*columns.values())
+    ]
+
+    return data_output
+
+
+def file_signature(filename: str) -> dict:
+    """
+    Signature of a raw file, used to detect changes for --incremental
+    """
+    stat = os.stat(filename)
+    with open(filename, "rb") as f:
+        sha256 = hashlib.sha256(f.read()).hexdigest()
+    return {"mtime": stat.st_mtime, "size": stat.st_size, "sha256": sha256}
+
+
+def up_to_date(
+    logfile: str, output_filename: str, record: dict, settings: dict
+) -> bool:
+    """
+    Checks if the processed output of a raw file, recorded in the manifest, is up
+    to date. The raw file content is only hashed if its mtime or size changed.
+    """
+    if record is None or not os.path.exists(output_filename):
+        return False
+    if any(record.get(key) != value for key, value in settings.items()):
+        return False
+
+    stat = os.stat(logfile)
+    if record["mtime"] == stat.st_mtime and record["size"] == stat.st_size:
+        return True
+    return record["sha256"] == file_signature(logfile)["sha256"]
+
+
+def process_file(logfile: str, logdir: str, dt: float, columnar: bool) -> tuple:
+    """
+    Processes a raw log file, returns its filename and its signature
+    """
+    signature = file_signature(logfile)
+    with open(logfile) as f:
+        data = json.load(f)
     duration = data["entries"][-1]["timestamp"]
-    print(f"* Processing {logfile} with duration {duration:.2f}s")
-    ts = np.arange(0.0, duration, args.dt)
-    frame = 0
-
-    for t in ts:
-        while t > data["entries"][frame + 1]["timestamp"]:
-            frame += 1
-        entry_1 = data["entries"][frame]
-        entry_2 = data["entries"][frame + 1]
-        new_entry = {}
-
-        for key in entry_1:
-            if key == "timestamp":
-                continue
-            new_entry[key] = entry_1[key] + (entry_2[key] - entry_1[key]) * (
-                t - entry_1["timestamp"]
-            ) / (entry_2["timestamp"] - entry_1["timestamp"])
-
-        new_entry["torque_enable"] = (
-            True if (new_entry["torque_enable"] > 0.5) else False
-        )
-        new_entry["timestamp"] = t
-
-        data_output["entries"].append(new_entry)
 
     filename = os.path.basename(logfile)
-    output_filename = f"{args.logdir}/{filename}"
-    json.dump(data_output, open(output_filename, "w"))
+    save_log(resample(data, dt), f"{logdir}/{filename}", columnar=columnar)
+
+    print(f"* Processed {logfile} with duration {duration:.2f}s")
+    return logfile, signature
+
+
+def process(
+    raw: str,
+    logdir: str,
+    dt: float = 0.005,
+    format: str = "json",
+    jobs: int | None = None,
+    incremental: bool = False,
+) -> list[str]:
+    """
+    Processes the raw logs of a directory: resamples them at a fixed timestep and
+    saves them in the processed logs directory.
+
+    :param raw: Directory of the raw ``*.json`` log files.
+    :param logdir: Directory the processed logs are written to.
+    :param dt: Timestep of the processed logs [s].
+    :param format: ``json``, or ``columnar`` (JSON header + ``.npy`` array of the
+        entries, memory-mapped on load).
+    :param jobs: Number of files processed in parallel (default: the number of
+        CPUs).
+    :param incremental: Skip the raw files already processed (with the same
+        settings) since their last change, as recorded in the manifest of
+        ``logdir``.
+    :returns: The filenames of the processed logs (the skipped ones excluded).
+    """
+    if jobs is None:
+        jobs = os.cpu_count()
+
+    manifest_filename = f"{logdir}/{MANIFEST}"
+    manifest = {}
+    if incremental and os.path.exists(manifest_filename):
+        with open(manifest_filename) as f:
+            manifest = json.load(f)
+
+    settings = {"dt": dt, "format": format}
+    raw_files = sorted(glob.glob(f"{raw}/*.json"))
+    logfiles = []
+    for logfile in raw_files:
+        output_filename = f"{logdir}/{os.path.basename(logfile)}"
+        if incremental and up_to_date(
+            logfile, output_filename, manifest.get(os.path.basename(logfile)), settings
+        ):
+            continue
+        logfiles.append(logfile)
+
+    skipped = len(raw_files) - len(logfiles)
+    if skipped:
+        print(f"* Skipping {skipped} up to date files")
+
+    process_logfile = partial(
+        process_file, logdir=logdir, dt=dt, columnar=format == "columnar"
+    )
+    if jobs > 1 and len(logfiles) > 1:
+        with multiprocessing.Pool(min(jobs, len(logfiles))) as pool:
+            results = list(pool.imap_unordered(process_logfile, logfiles))
+    else:
+        results = [process_logfile(logfile) for logfile in logfiles]
+
+    for logfile, signature in results:
+        manifest[os.path.basename(logfile)] = {**signature, **settings}
+    with open(manifest_filename, "w") as f:
+        json.dump(manifest, f)
+
+    return [f"{logdir}/{os.path.basename(logfile)}" for logfile in logfiles]
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--raw", type=str, required=True)
+    arg_parser.add_argument("--logdir", type=str, required=True)
+    arg_parser.add_argument("--dt", type=float, default=0.005)
+    arg_parser.add_argument(
+        "--format",
+        type=str,
+        default="json",
+        choices=["json", "columnar"],
+        help="columnar: JSON header + .npy array of the entries, memory-mapped on load",
+    )
+    arg_parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of files processed in parallel",
+    )
+    arg_parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Skip the raw files already processed (with the same settings) since "
+        "their last change",
+    )
+    args = arg_parser.parse_args()
+
+    process(args.raw, args.logdir, args.dt, args.format, args.jobs, args.incremental)
@@ -9,6 +9,44 @@
 import numpy as np
 from copy import copy
 from .model import Model
+from .backend import ArrayLike
+from .logs import Dataset, columns, valid_steps
+
+
+def _equal(a: ArrayLike | None, b: ArrayLike | None) -> bool:
+    """
+    Checks if two step inputs or states (floats, arrays or None) are exactly equal
+    """
+    if a is None or b is None:
+        return a is b
+    if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+        return bool(np.array_equal(a, b))
+    return bool(a == b)
+
+
+# Outputs of the rollouts, see Simulator.rollout_log
+OUTPUTS = ("positions", "velocities", "controls")
+
+
+def reset_steps(n_steps: int, dt: float, reset_period: float | None) -> np.ndarray:
+    """Steps at which the rollouts re-synchronize their state to the log.
+
+    :param n_steps: Number of steps of the log.
+    :param dt: Timestep [s].
+    :param reset_period: Reset period [s], or None.
+    :returns: The first steps of the segments between the resets (0 being the first
+        one), that can be simulated independently.
+    """
+    starts = [0]
+    if reset_period is not None:
+        reset_period_t = 0.0
+        for k in range(n_steps):
+            reset_period_t += dt
+            if reset_period_t > reset_period:
+                reset_period_t = 0.0
+                if k > 0:
+                    starts.append(k)
+    return np.array(starts)
 
 
 class Simulator:
@@ -20,17 +58,27 @@ class Simulator:
     identification loss.
 
     :param model: BAM friction model to simulate.
+    :param fast_forward: Skip the steps that can't change the state (see
+        :meth:`steps`). Only single rollouts (not batches) are fast-forwarded.
     """
 
-    def __init__(self, model: Model):
+    def __init__(self, model: Model, fast_forward: bool = True):
         self.screen = None
         self.model = model
+        self.fast_forward = fast_forward
         self.reset()
 
     def reset(self, q: float = 0.0, dq: float = 0.0):
         """
         Resets the simulation to a given state
         """
+        batch_size = self.model.parameters_batch_size
+        if batch_size is not None:
+            # Parameters are column vectors, the state is (parameter sets x logs)
+            q, dq = np.broadcast_arrays(np.atleast_1d(q), np.atleast_1d(dq))
+            q = np.broadcast_to(q, (batch_size, len(q))).astype(float)
+            dq = np.broadcast_to(dq, (batch_size, len(dq))).astype(float)
+
         self.q = copy(q)
         self.dq = copy(dq)
         self.t = 0.0
@@ -63,72 +111,276 @@ class Simulator:
             + self.model.actuator.get_extra_inertia()
         )
         net_torque = motor_torque + bias_torque
+        backend = self.model.actuator.backend
 
         # Tau_stop is the torque required to stop the motor (reach a velocity of 0 after dt)
         tau_stop = (inertia / dt) * self.dq + net_torque
-        static_friction = -np.sign(tau_stop) * np.min(
-            [np.abs(tau_stop), frictionloss + damping * np.abs(self.dq)], axis=0
+        static_friction = -backend.sign(tau_stop) * backend.minimum(
+            abs(tau_stop), frictionloss + damping * abs(self.dq)
         )
-        net_torque += static_friction
+        net_torque = net_torque + static_friction
 
         angular_acceleration = net_torque / inertia
 
-        self.dq += angular_acceleration * dt
-        self.dq = np.clip(self.dq, -100.0, 100.0)
-        self.q += self.dq * dt + 0.5 * angular_acceleration * dt**2
+        # State is not updated in place, as it may be broadcast to a larger shape
+        self.dq = backend.clamp(self.dq + angular_acceleration * dt, -100.0, 100.0)
+        self.q = self.q + (self.dq * dt + 0.5 * angular_acceleration * dt**2)
         self.t += dt
 
-    def rollout_log(
-        self, log: dict, reset_period: float = None, simulate_control: bool = False
+    def steps(
+        self,
+        log: dict,
+        reset_period: float | None = None,
+        simulate_control: bool = False,
     ):
+        """Roll out the model against a recorded log, step by step.
+
+        Generator version of :meth:`rollout_log` (same parameters), which can be
+        stopped at any time.
+
+        With ``fast_forward``, when a step left the state unchanged (typically a
+        joint held by the static friction, with ``dq`` going to zero), the
+        following steps with the same control and ``torque_enable`` are skipped:
+        :meth:`step` is deterministic, so it would give back the same state. The
+        control is still computed at each step (it may depend on the actuator
+        internal state), so the holds are left exactly where stepping would leave
+        them, and the results are identical.
+
+        :returns: Yields ``(position, velocity, control, k)`` at each timestep k.
+        """
+        channels = columns(log)
+        positions = channels["position"]
+        speeds = channels.get("speed")
+        log_controls = channels.get("control")
+
+        dt = log["dt"]
+        self.reset(positions[0], 0.0 if speeds is None else speeds[0])
+        self.model.actuator.load_log(log)
+
+        # In a log batch, dt is a vector (the logs are expected to share it)
+        reset_dt = dt if np.isscalar(dt) else max(dt)
+        resets = set(reset_steps(len(positions), reset_dt, reset_period)[1:].tolist())
+
+        # Inputs (control, torque_enable) of the last step, if it left the state
+        # unchanged. In a batch, all the rollouts are hardly ever held at once, so
+        # only single rollouts are fast-forwarded
+        fast_forward = self.fast_forward and np.ndim(self.q) == 0
+        hold = None
+
+        for k, (goal_position, torque_enable) in enumerate(
+            zip(channels["goal_position"], channels["torque_enable"])
+        ):
+            if k in resets:
+                self.reset(positions[k], 0.0 if speeds is None else speeds[k])
+                hold = None
+            q, dq = self.q, self.dq
+
+            if simulate_control:
+                control = self.model.actuator.compute_control(
+                    goal_position, self.q, self.dq, dt
+                )
+            elif log_controls is not None:
+                control = log_controls[k]
+            else:
+                control = self.model.actuator.compute_control(
+                    goal_position, positions[k], self.dq, dt
+                )
+
+            yield q, dq, control, k
+
+            if (
+                hold is not None
+                and _equal(control, hold[0])
+                and _equal(torque_enable, hold[1])
+            ):
+                # The state is a fixed point of the step with these inputs
+                self.t += dt
+                continue
+
+            self.step(control, torque_enable, dt)
+            if fast_forward and _equal(self.dq, dq) and _equal(self.q, q):
+                hold = (control, torque_enable)
+            else:
+                hold = None
+
+    def rollout_log(
+        self,
+        log: dict,
+        reset_period: float | None = None,
+        simulate_control: bool = False,
+        outputs: tuple = OUTPUTS,
+    ) -> tuple:
         """Roll out the model against a recorded log and return predicted trajectories.
 
         :param log: Processed log dict as returned by :meth:`bam.logs.Logs.make_batch`
-            or loaded directly from a processed JSON file.
+            or loaded directly from a processed JSON file, or a compiled
+            :class:`bam.logs.Dataset`.
         :param reset_period: If set, re-synchronize the simulator state to the
             log at this interval [s]. Useful when error accumulation destabilizes
             long rollouts.
         :param simulate_control: If ``True``, recompute the control signal from
             the simulated state using the firmware control law. If ``False``,
             use the control values recorded in the log.
-        :returns: Tuple ``(positions, velocities, controls)`` — lists of values
-            at each timestep.
+        :param outputs: Outputs to return, among ``"positions"``, ``"velocities"``
+            and ``"controls"`` (see :meth:`rollout_mae` for the position error only).
+        :returns: Tuple of the requested outputs (by default ``(positions,
+            velocities, controls)``), arrays whose first axis is the timestep.
         """
-        positions = []
-        velocities = []
-        controls = []
+        n_steps = log.n_steps if isinstance(log, Dataset) else len(log["entries"])
+        selected = [OUTPUTS.index(output) for output in outputs]
 
-        reset_period_t = 0.0
-        dt = log["dt"]
-        first_entry = log["entries"][0]
-        self.reset(
-            first_entry["position"],
-            first_entry["speed"] if "speed" in first_entry else 0.0,
+        arrays = None
+        for q, dq, control, k in self.steps(log, reset_period, simulate_control):
+            values = (q, dq, control)
+            if arrays is None:
+                # Allocated once the shapes of the values are known
+                arrays = [np.empty((n_steps,) + np.shape(values[i])) for i in selected]
+            for array, i in zip(arrays, selected):
+                array[k] = values[i]
+
+        return tuple(arrays)
+
+    def rollout_segments(
+        self,
+        log: dict,
+        reset_period: float,
+        simulate_control: bool = False,
+        outputs: tuple = OUTPUTS,
+    ) -> tuple:
+        """Roll out the model against a recorded log with a reset period, all the
+        segments between the resets being simulated at once.
+
+        The segments are independent of each other, so instead of the T steps of
+        :meth:`rollout_log`, the log (or each log of a dataset) is cut in its
+        segments (see :meth:`bam.logs.Dataset.segments`) and they are all rolled
+        out in parallel, in ``reset_period / dt`` steps of a wider batch. The
+        trajectories are the same. The actuators with an internal control state
+        (see :attr:`bam.actuator.Actuator.control_state`, e.g. the STS3215
+        smoothed target) are not supported, since that state is carried over the
+        resets, and would restart at each segment.
+
+        :param log: Processed log dict or :class:`bam.logs.Dataset`.
+        :param reset_period: See :meth:`rollout_log`.
+        :param simulate_control: See :meth:`rollout_log`.
+        :param outputs: See :meth:`rollout_log`.
+        :returns: See :meth:`rollout_log`.
+        :raises ValueError: If the actuator has an internal control state.
+        """
+        if self.model.actuator.control_state:
+            raise ValueError(
+                "The segments of the rollouts are not independent for an actuator "
+                "with an internal control state"
+            )
+        dataset = log if isinstance(log, Dataset) else Dataset([log])
+        starts = reset_steps(dataset.n_steps, np.max(dataset["dt"]), reset_period)
+        result = self.rollout_log(
+            dataset.segments(starts), simulate_control=simulate_control, outputs=outputs
         )
-        self.model.actuator.load_log(log)
 
-        for entry in log["entries"]:
-            reset_period_t += dt
-            if reset_period is not None and reset_period_t > reset_period:
-                reset_period_t = 0.0
-                self.reset(entry["position"], entry["speed"])
-            positions.append(copy(self.q))
-            velocities.append(copy(self.dq))
+        # Segment (and step in the segment) of each step of the logs
+        steps = np.arange(dataset.n_steps)
+        segments = np.searchsorted(starts, steps, side="right") - 1
+        offsets = steps - starts[segments]
 
-            if simulate_control:
-                control = self.model.actuator.compute_control(
-                    entry["goal_position"], self.q, self.dq, dt
-                )
-            else:
-                if "control" in entry:
-                    control = entry["control"]
-                else:
-                    control = self.model.actuator.compute_control(
-                        entry["goal_position"], entry["position"], self.dq, dt
-                    )
+        arrays = []
+        for values in result:
+            # (segment steps, ..., logs x segments) -> (steps, ..., logs)
+            values = values.reshape(values.shape[:-1] + (len(dataset), len(starts)))
+            values = values[offsets, ..., segments]
+            arrays.append(values if isinstance(log, Dataset) else values[..., 0])
+        return tuple(arrays)
+
+    def rollout_mae(
+        self,
+        log: dict,
+        reset_period: float | None = None,
+        simulate_control: bool = False,
+        max_mae: float | None = None,
+    ) -> tuple:
+        """Roll out the model against a recorded log and return its mean absolute
+        position error.
+
+        The absolute error only accumulates along the rollout, so once it exceeds
+        ``max_mae`` times the number of (log) values, the final MAE is known to be
+        above ``max_mae`` and the rollout is aborted. This is used to prune the
+        candidates that can't beat the best one during the fitting.
+
+        :param log: Processed log dict, log batch or dataset. The padding steps (of a
+            padded log batch or a dataset) are ignored.
+        :param reset_period: See :meth:`rollout_log`.
+        :param simulate_control: See :meth:`rollout_log`.
+        :param max_mae: If set, abort the rollout as soon as the MAE is proven to be
+            above this value (for a batched model, it can be a vector of one value
+            per parameter set).
+        :returns: Tuple ``(mae, complete)``. If the rollout was aborted, ``complete``
+            is ``False`` and ``mae`` is the MAE over the simulated steps (which is
+            above ``max_mae`` as well, and ranks the aborted rollouts). For a
+            batched model, arrays of P values (a batch is aborted once all its
+            parameter sets are).
+        """
+        log_positions = columns(log)["position"]
+        mask = valid_steps(log)
+        n_values = np.count_nonzero(mask)
+        max_error = np.inf if max_mae is None else max_mae * n_values
+
+        error = 0.0
+        n_steps = 0
+        complete = True
+        for q, _, _, k in self.steps(log, reset_period, simulate_control):
+            error = error + abs(q - log_positions[k]) * mask[k]
+            n_steps += 1
+            # The bound is checked periodically, summing over the logs is not free
+            if (
+                max_mae is not None
+                and n_steps % 10 == 0
+                and np.all(self._sum_logs(error) > max_error)
+            ):
+                complete = False
+                break
+        total_error = self._sum_logs(error)
+
+        if self.model.parameters_batch_size is not None:
+            complete = np.full(self.model.parameters_batch_size, complete)
+        return total_error / np.count_nonzero(mask[:n_steps]), complete
 
-            controls.append(copy(control))
+    def _sum_logs(self, error: ArrayLike) -> ArrayLike:
+        """
+        Sums an error over the logs of a batch, keeping the parameter sets axis
+        """
+        if self.model.parameters_batch_size is not None:
+            return np.sum(error, axis=-1)
+        return np.sum(error)
+
+    def rollout_batch(
+        self,
+        log: dict,
+        reset_period: float | None = None,
+        simulate_control: bool = False,
+    ) -> tuple:
+        """Roll out a parameters batch against a log batch.
+
+        The model is expected to be batched over P parameter sets (see
+        :meth:`bam.model.Model.set_parameters_batch`) and ``log`` to be a batch of
+        N logs (see :meth:`bam.logs.Logs.make_batch`), or a single log (N = 1).
+        All the P x N rollouts run in the single time loop of :meth:`rollout_log`.
 
-            self.step(control, entry["torque_enable"], dt)
+        :param log: Processed log dict or log batch.
+        :param reset_period: See :meth:`rollout_log`.
+        :param simulate_control: See :meth:`rollout_log`.
+        :returns: Tuple ``(positions, velocities, controls)`` of arrays of shape
+            ``(P, N, T)``.
+        """
+        if self.model.parameters_batch_size is None:
+            raise ValueError(
+                "The model is not batched, call model.set_parameters_batch() first"
+            )
 
-        return positions, velocities, controls
+        result = self.rollout_log(log, reset_period, simulate_control)
+        shape = np.shape(self.q)
+
+        return tuple(
+            np.moveaxis(
+                np.broadcast_to(values, values.shape[:1] + shape), 0, -1
+            ).astype(float)
+            for values in result
+        )
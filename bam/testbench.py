@@ -6,7 +6,7 @@
 
 #     http://www.apache.org/licenses/LICENSE-2.0
 
-import numpy as np
+from .backend import Backend, NumpyBackend
 
 
 class Testbench:
@@ -20,8 +20,13 @@ class Testbench:
 
     where :math:`\\tau_m` is the motor torque, :math:`\\tau_e` the external
     (bias) torque, and :math:`M(q)` the effective inertia.
+
+    The testbench shares the array backend of the actuator that loads it (see
+    :meth:`bam.actuator.Actuator.load_log`).
     """
 
+    backend: Backend = NumpyBackend()
+
     def compute_mass(self, q: float, dq: float) -> float:
         """Return the effective inertia at the current state [kg·m²].
 
@@ -72,4 +77,4 @@ class Pendulum(Testbench):
         :param dq: Joint velocity [rad/s] (unused).
         """
         g = -9.80665
-        return (self.mass + self.arm_mass / 2) * g * self.length * np.sin(q)
+        return (self.mass + self.arm_mass / 2) * g * self.length * self.backend.sin(q)
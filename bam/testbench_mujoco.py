@@ -33,8 +33,13 @@ class Pendulum:
     exactly reproducing :meth:`bam.testbench.Pendulum.compute_mass` and
     :meth:`bam.testbench.Pendulum.compute_bias`.
 
+    The parameters can also be arrays (e.g. from a compiled
+    :class:`bam.logs.Dataset`), in which case the spec holds one independent
+    pendulum per element (see :meth:`build_spec`), so that a single ``mj_step``
+    advances a whole batch of logs.
+
     :param log: Log dict containing ``"mass"`` [kg], ``"arm_mass"`` [kg], and
-        ``"length"`` [m] keys.
+        ``"length"`` [m] keys (scalars, or arrays for a stacked spec).
     """
 
     #: Gravity magnitude, matching :data:`bam.testbench` (g = -9.80665).
@@ -45,6 +50,23 @@ class Pendulum:
         self.arm_mass = log["arm_mass"]
         self.length = log["length"]
 
+    @property
+    def size(self) -> int | None:
+        """Number of stacked pendulums, None for a single one."""
+        if np.ndim(self.mass) == 0 and np.ndim(self.length) == 0:
+            return None
+        return np.broadcast(self.mass, self.arm_mass, self.length).size
+
+    def joint_names(self, name: str = "pendulum") -> list[str]:
+        """Names of the hinge joints (and actuators) of :meth:`build_spec`.
+
+        :param name: Name given to :meth:`build_spec`.
+        :returns: ``[name]`` for a single pendulum, else ``name_0``, ``name_1`` …
+        """
+        if self.size is None:
+            return [name]
+        return [f"{name}_{i}" for i in range(self.size)]
+
     def inertial_params(self) -> tuple[float, float, float]:
         """Return the MuJoCo body inertial matching the analytic testbench.
 
@@ -68,16 +90,22 @@ class Pendulum:
         inertia_com = inertia_pivot - total_mass * com_z**2
         # A point mass has zero inertia about its own COM, which MuJoCo would
         # reject; floor it. Only rotation about x (the hinge axis) matters.
-        inertia_x = max(inertia_com, 1e-9)
+        inertia_x = np.maximum(inertia_com, 1e-9)
         return total_mass, com_z, inertia_x
 
     def build_spec(self, name: str = "pendulum") -> mujoco.MjSpec:
         """Build and return a MuJoCo spec for this pendulum.
 
+        With array parameters, the spec holds one pendulum per element, each with
+        its own inertial, hinge and actuator (named as :meth:`joint_names`). They
+        are spread along the hinge axis, so that they never overlap, and are
+        independent: a :class:`~bam.mujoco.MujocoController` created with all the
+        joint names drives the whole batch.
+
         :param name: Name given to both the hinge joint and the (motor) actuator.
             This is the name the :class:`~bam.mujoco.MujocoController` is created with.
         :returns: A :class:`mujoco.MjSpec` with a single hinge joint and a
-            direct-torque (motor) actuator.
+            direct-torque (motor) actuator (or one per stacked pendulum).
         """
         spec = mujoco.MjSpec()
         spec.option.gravity = [0.0, 0.0, -self.G]
@@ -89,7 +117,14 @@ class Pendulum:
             mujoco.mjtInertiaFromGeom.mjINERTIAFROMGEOM_FALSE
         )
 
-        length = self.length
+        names = self.joint_names(name)
+        total_mass, com_z, inertia_x = (
+            np.broadcast_to(value, (len(names),)) for value in self.inertial_params()
+        )
+        lengths = np.broadcast_to(self.length, (len(names),))
+        # Stacked pendulums are spread along the hinge (x) axis, around the origin
+        spacing = 0.5 * np.max(lengths)
+        offsets = (np.arange(len(names)) - (len(names) - 1) / 2.0) * spacing
 
         # ── Scenery (purely visual, no collisions so the pendulum dynamics are
         # identical to the analytic testbench) ──────────────────────────────
@@ -127,28 +162,58 @@ class Pendulum:
         floor = spec.worldbody.add_geom(
             name="floor",
             type=mujoco.mjtGeom.mjGEOM_PLANE,
-            pos=[0.0, 0.0, -(length + 0.12)],
-            size=[2.0, 2.0, 0.1],
+            pos=[0.0, 0.0, -(np.max(lengths) + 0.12)],
+            size=[max(2.0, offsets[-1] + 1.0), 2.0, 0.1],
             material="grid",
             contype=0,
             conaffinity=0,
         )
 
-        body = spec.worldbody.add_body(name=name, pos=[0.0, 0.0, 0.0])
+        for i, joint_name in enumerate(names):
+            self.add_pendulum(
+                spec,
+                joint_name,
+                [offsets[i], 0.0, 0.0],
+                lengths[i],
+                (total_mass[i], com_z[i], inertia_x[i]),
+                "" if self.size is None else f"_{i}",
+            )
+
+        return spec
+
+    @staticmethod
+    def add_pendulum(
+        spec: mujoco.MjSpec,
+        name: str,
+        pos: list,
+        length: float,
+        inertial: tuple,
+        suffix: str = "",
+    ):
+        """Add a pendulum body, its hinge and its actuator to a spec.
+
+        :param spec: Spec to add the pendulum to.
+        :param name: Name of the body, the hinge joint and the actuator.
+        :param pos: Position of the pivot [m].
+        :param length: Arm length [m].
+        :param inertial: Body inertial, see :meth:`inertial_params`.
+        :param suffix: Suffix of the names of the (visual) geoms.
+        """
+        body = spec.worldbody.add_body(name=name, pos=pos)
         body.add_joint(
             name=name,
             type=mujoco.mjtJoint.mjJNT_HINGE,
             axis=[1.0, 0.0, 0.0],
         )
 
-        total_mass, com_z, inertia_x = self.inertial_params()
+        total_mass, com_z, inertia_x = inertial
         body.mass = total_mass
         body.ipos = [0.0, 0.0, com_z]
         body.inertia = [inertia_x, inertia_x, inertia_x]
 
         # Visual arm: a brown stick (no mass/collision, inertia set explicitly).
         body.add_geom(
-            name="arm",
+            name=f"arm{suffix}",
             type=mujoco.mjtGeom.mjGEOM_CAPSULE,
             fromto=[0.0, 0.0, 0.0, 0.0, 0.0, -length],
             size=[max(length * 0.025, 1e-3), 0.0, 0.0],
@@ -160,7 +225,7 @@ class Pendulum:
         # Fake tip mass: a dark cylinder centered at the end of the arm.
         bob_half = max(length * 0.06, 1e-3)
         body.add_geom(
-            name="bob",
+            name=f"bob{suffix}",
             type=mujoco.mjtGeom.mjGEOM_CYLINDER,
             fromto=[
                 0.0,
@@ -182,8 +247,6 @@ class Pendulum:
         actuator.target = name
         actuator.trntype = mujoco.mjtTrn.mjTRN_JOINT
 
-        return spec
-
 
 if __name__ == "__main__":
     import argparse
@@ -0,0 +1,212 @@
+# Copyright 2025 Marc Duclusaud & Grégoire Passault
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+"""Differentiable (PyTorch) version of :class:`bam.simulate.Simulator`.
+
+The reference simulation loop (control law, motor torque, friction budget,
+stopping-torque clipping and integration) is written against the array
+:class:`~bam.backend.Backend`, so it runs unchanged on torch tensors. This
+module feeds it tensors: the log is converted once, the actuator and testbench
+are switched to the :class:`~bam.backend.TorchBackend`, and the model parameters
+may be tensors requiring gradients. The mean absolute error of a rollout can
+then be backpropagated to the parameters, which is what ``bam.fit --method
+adam`` and ``--method lbfgs`` do.
+"""
+
+import weakref
+import numpy as np
+import torch
+
+from .model import Model
+from .logs import Dataset, columns, valid_steps
+from .backend import TorchBackend
+from . import simulate
+
+
+def log_to_torch(
+    log: dict | Dataset, dtype=torch.float64, device="cpu"
+) -> dict | Dataset:
+    """Convert a log (or a log batch, or a dataset) to torch tensors.
+
+    Numerical arrays (entries values, and metadata of a log batch) become tensors,
+    numerical scalars become floats and other values (``filename``, ``motor`` …)
+    are kept as is.
+
+    :param log: Processed log dict, log batch (see :meth:`bam.logs.Logs.make_batch`)
+        or :class:`bam.logs.Dataset`.
+    :param dtype: Tensors dtype.
+    :param device: Tensors device.
+    :returns: A new log dict (or dataset).
+    """
+    if isinstance(log, Dataset):
+        return log.map(
+            lambda array: torch.as_tensor(
+                array.astype(float), dtype=dtype, device=device
+            )
+        )
+
+    def convert(value):
+        if isinstance(value, np.ndarray) and value.dtype.kind in "biuf":
+            return torch.as_tensor(value.astype(float), dtype=dtype, device=device)
+        if isinstance(value, (bool, int, float, np.number, np.bool_)):
+            return float(value)
+        return value
+
+    torch_log = {key: convert(value) for key, value in log.items() if key != "entries"}
+    torch_log["entries"] = [
+        {key: convert(value) for key, value in entry.items()}
+        for entry in log["entries"]
+    ]
+    return torch_log
+
+
+class Simulator(simulate.Simulator):
+    """Torch counterpart of :class:`bam.simulate.Simulator`.
+
+    Logs are converted to tensors with :func:`log_to_torch` (and cached, so that
+    the same log can be rolled out many times, e.g. during gradient descent), and
+    the rollouts return tensors that are differentiable with respect to the model
+    parameters set as tensors.
+
+    :param model: BAM friction model to simulate. Its actuator is switched to the
+        :class:`~bam.backend.TorchBackend`.
+    :param dtype: Tensors dtype.
+    :param device: Tensors device.
+    """
+
+    def __init__(self, model: Model, dtype=torch.float64, device="cpu"):
+        self.dtype = dtype
+        self.device = device
+        self.torch_logs: dict[int, tuple[dict, dict]] = {}
+        # Datasets are weakly referenced, their torch versions are dropped with them
+        # (e.g. the segments cut at each rollout_segments() call)
+        self.torch_datasets = weakref.WeakKeyDictionary()
+
+        model.actuator.backend = TorchBackend()
+        # Skipping the held steps would give the same trajectories, but not the
+        # same gradients
+        super().__init__(model, fast_forward=False)
+
+    def to_torch(self, log: dict) -> dict:
+        """Return the torch version of a log, converted once and cached.
+
+        :param log: Processed log dict, log batch or :class:`bam.logs.Dataset`.
+        """
+        if isinstance(log, Dataset):
+            if log not in self.torch_datasets:
+                self.torch_datasets[log] = log_to_torch(log, self.dtype, self.device)
+            return self.torch_datasets[log]
+        if id(log) not in self.torch_logs:
+            # The original log is kept alive, so that its id can't be reused
+            self.torch_logs[id(log)] = (log, log_to_torch(log, self.dtype, self.device))
+        return self.torch_logs[id(log)][1]
+
+    def reset(self, q: float = 0.0, dq: float = 0.0):
+        q = torch.as_tensor(q, dtype=self.dtype, device=self.device)
+        dq = torch.as_tensor(dq, dtype=self.dtype, device=self.device)
+        batch_size = self.model.parameters_batch_size
+        if batch_size is not None:
+            # Parameters are column vectors, the state is (parameter sets x logs)
+            q, dq = torch.broadcast_tensors(torch.atleast_1d(q), torch.atleast_1d(dq))
+            q = q.expand(batch_size, len(q))
+            dq = dq.expand(batch_size, len(dq))
+
+        self.q = q
+        self.dq = dq
+        self.t = 0.0
+
+        self.model.reset()
+
+    def rollout_log(
+        self,
+        log: dict,
+        reset_period: float | None = None,
+        simulate_control: bool = False,
+        outputs: tuple = simulate.OUTPUTS,
+    ) -> tuple:
+        """Roll out the model against a recorded log, see
+        :meth:`bam.simulate.Simulator.rollout_log`.
+
+        :returns: Tuple of the requested outputs, tensors whose first axis is the
+            timestep (stacked keeping the autograd graph).
+        """
+        selected = [simulate.OUTPUTS.index(output) for output in outputs]
+        lists = [[] for _ in selected]
+        for values in self.steps(self.to_torch(log), reset_period, simulate_control):
+            for values_list, i in zip(lists, selected):
+                values_list.append(values[i])
+
+        # The first values may not have the batch shape yet (e.g. logged controls)
+        return tuple(
+            torch.stack(
+                torch.broadcast_tensors(
+                    *(
+                        torch.as_tensor(value, dtype=self.dtype, device=self.device)
+                        for value in values_list
+                    )
+                )
+            )
+            for values_list in lists
+        )
+
+    def rollout_batch(
+        self,
+        log: dict,
+        reset_period: float | None = None,
+        simulate_control: bool = False,
+    ) -> tuple:
+        """Roll out a parameters batch against a log batch, see
+        :meth:`bam.simulate.Simulator.rollout_batch`.
+
+        The parameters batched as numpy arrays (see
+        :meth:`bam.model.Model.set_parameters_batch`) are converted to tensors, the
+        ones set as (P x 1) tensors are kept (e.g. to compute their gradients).
+
+        :returns: Tuple ``(positions, velocities, controls)`` of tensors of shape
+            ``(P, N, T)``.
+        """
+        if self.model.parameters_batch_size is None:
+            raise ValueError(
+                "The model is not batched, call model.set_parameters_batch() first"
+            )
+        for parameter in self.model.get_parameters().values():
+            if isinstance(parameter.value, np.ndarray):
+                parameter.value = torch.as_tensor(
+                    parameter.value, dtype=self.dtype, device=self.device
+                )
+
+        result = self.rollout_log(log, reset_period, simulate_control)
+        shape = self.q.shape
+
+        return tuple(
+            torch.movedim(values.expand(values.shape[:1] + shape), 0, -1)
+            for values in result
+        )
+
+
+def mae(positions: list, log: dict | Dataset) -> torch.Tensor:
+    """Differentiable mean absolute error between rolled out and logged positions.
+
+    :param positions: Positions returned by :meth:`Simulator.rollout_log` (or a
+        list of the positions at each timestep).
+    :param log: The torch log the positions were rolled out against (see
+        :meth:`Simulator.to_torch`). The padding steps (of a padded log batch or
+        a dataset) are ignored.
+    """
+    if not isinstance(positions, torch.Tensor):
+        positions = torch.stack(positions)
+    log_positions = columns(log)["position"]
+    if isinstance(log, Dataset):
+        mask = log.mask.T
+    else:
+        log_positions = torch.stack(log_positions)
+        mask = torch.as_tensor(valid_steps(log), dtype=positions.dtype).reshape(
+            log_positions.shape
+        )
+    errors = torch.abs(positions - log_positions) * mask
+    return torch.sum(errors) / torch.sum(mask)